@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+import psutil
+# not tests.adapters, which imports torch: its few hundred MB would dominate the peak RSS of small runs
+from tests.train_bpe import BPETrainer, TrainStats, count_pre_tokens
+
+SPECIAL_TOKENS = ["<|endoftext|>"]
+# rough English letter frequencies, so that the pair statistics are not uniform
+LETTERS = "etaoinshrdlcumwfgypbvkjxqz"
+LETTER_FREQUENCIES = [12.7, 9.1, 8.2, 7.5, 7.0, 6.7, 6.3, 6.1, 6.0, 4.3, 4.0, 2.8, 2.8,
+                      2.4, 2.4, 2.2, 2.0, 2.0, 1.9, 1.5, 1.0, 0.8, 0.2, 0.2, 0.1, 0.1]
+
+
+def synthetic_words(num_words, rng):
+    """Distinct random lowercase words, sorted by length so that the most frequent ranks are the shortest"""
+    letter_p = np.array(LETTER_FREQUENCIES) / sum(LETTER_FREQUENCIES)
+    words = {}
+    while len(words) < num_words:
+        lengths = rng.poisson(4.0, num_words) + 1
+        letters = rng.choice(len(LETTERS), size=int(lengths.sum()), p=letter_p)
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            words["".join(LETTERS[i] for i in letters[start:end])] = None
+    return sorted(list(words)[:num_words], key=len)
+
+
+def write_zipf_corpus(path, size_bytes, seed=0, num_words=50_000, zipf_s=1.1):
+    """
+    Write a synthetic corpus of about `size_bytes` bytes whose words follow a Zipf law (p(rank) ~ rank^-s),
+    in TinyStories-like documents: capitalized sentences, commas, numbers, paragraphs and <|endoftext|>.
+    """
+    rng = np.random.default_rng(seed)
+    words = np.array(synthetic_words(num_words, rng), dtype=object)
+    word_p = np.arange(1, num_words + 1, dtype=np.float64) ** -zipf_s
+    word_p /= word_p.sum()
+
+    tmp_path = f"{path}.tmp"
+    written = 0
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        while written < size_bytes:
+            tokens = words[rng.choice(num_words, size=1 << 16, p=word_p)].tolist()
+            numbers = rng.random(len(tokens)) < 0.01
+            for i in np.flatnonzero(numbers):
+                tokens[i] = str(rng.integers(0, 1000))
+            sentence_lengths = rng.integers(4, 20, size=len(tokens) // 4)
+            parts = []
+            start = 0
+            for n_sentence, length in enumerate(sentence_lengths):
+                sentence = tokens[start:start + length]
+                if len(sentence) < length:
+                    break
+                start += length
+                if length > 8:
+                    sentence[length // 2] += ","
+                parts.append(" ".join(sentence).capitalize() + ".")
+                if n_sentence % 8 == 7:
+                    parts.append("\n")
+                if n_sentence % 40 == 39:
+                    parts.append("\n<|endoftext|>\n")
+                else:
+                    parts.append(" ")
+            block = "".join(parts)
+            f.write(block)
+            written += len(block.encode("utf-8"))
+    os.replace(tmp_path, path)
+
+
+def corpus_path(data_dir, size_mb, seed):
+    """Generate the synthetic corpus of `size_mb` MB once and reuse it across runs"""
+    path = os.path.join(data_dir, f"zipf_{size_mb}MB_seed{seed}.txt")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        start = time.perf_counter()
+        write_zipf_corpus(path, size_mb * 2**20, seed=seed)
+        print(f"   generated {path} in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return path
+
+
+def run_single(input_path, vocab_size, num_workers):
+    """
+    Train once and print the results as one JSON object, run in a fresh process to isolate peak memory.
+    The same steps as run_train_bpe, and the RSS of the process before training as a baseline.
+    """
+    baseline_rss_bytes = psutil.Process().memory_info().rss
+    stats = TrainStats()
+    start = time.perf_counter()
+    pre_token_frequency = count_pre_tokens(input_path, SPECIAL_TOKENS, num_workers=num_workers, stats=stats)
+    trainer = BPETrainer(pre_token_frequency, SPECIAL_TOKENS, stats=stats)
+    vocab, merges = trainer.train(vocab_size)
+    wall_seconds = time.perf_counter() - start
+    print(json.dumps({"wall_seconds": wall_seconds, "final_vocab_size": len(vocab),
+                      "baseline_rss_bytes": baseline_rss_bytes, **stats.as_dict()}))
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    """Time run_train_bpe on Zipfian synthetic corpora of increasing size and vocab sizes, as JSON lines"""
+    parser = argparse.ArgumentParser(description="BPE training scaling benchmark.")
+    parser.add_argument("--sizes_mb", type=int, nargs="+", default=[1, 10, 100, 1000],
+                        help="Sizes of the synthetic corpora in MB.")
+    parser.add_argument("--vocab_sizes", type=int, nargs="+", default=[500, 1000, 4000, 10000, 32000],
+                        help="Vocabulary sizes to train.")
+    parser.add_argument("--num_workers", type=int, default=None, help="Pre-tokenization processes.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic corpora.")
+    parser.add_argument("--data_dir", type=str, default="./data/synthetic",
+                        help="Where to generate (and cache) the synthetic corpora.")
+    parser.add_argument("--output_path", type=str, default="./data/bench/train_bpe_scaling.jsonl",
+                        help="JSON lines file the results are appended to.")
+    parser.add_argument("--single", nargs=2, metavar=("INPUT_PATH", "VOCAB_SIZE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single is not None:
+        run_single(args.single[0], int(args.single[1]), args.num_workers)
+        return
+
+    run_info = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "num_workers": args.num_workers,
+    }
+    os.makedirs(os.path.dirname(args.output_path) or ".", exist_ok=True)
+    print("=" * 60)
+    print("BPE TRAINING SCALING")
+    print("=" * 60)
+    print(f"   {'corpus':>8} {'vocab':>6} {'wall (s)':>9} {'merges/s':>9} {'peak RSS':>9} {'baseline':>9}")
+    for size_mb in args.sizes_mb:
+        input_path = corpus_path(args.data_dir, size_mb, args.seed)
+        for vocab_size in args.vocab_sizes:
+            command = [sys.executable, os.path.abspath(__file__), "--single", input_path, str(vocab_size)]
+            if args.num_workers is not None:
+                command += ["--num_workers", str(args.num_workers)]
+            completed = subprocess.run(command, capture_output=True, text=True, check=True)
+            result = {**run_info, "corpus_mb": size_mb, "vocab_size": vocab_size,
+                      **json.loads(completed.stdout.strip().splitlines()[-1])}
+            with open(args.output_path, "a") as f:
+                f.write(json.dumps(result) + "\n")
+            print(f"   {size_mb:>6}MB {vocab_size:>6} {result['wall_seconds']:>9.2f}"
+                  f" {result['merges_per_second']:>9.0f} {result['peak_rss_bytes'] / 2**20:>7.0f}MB"
+                  f" {result['baseline_rss_bytes'] / 2**20:>7.0f}MB")
+    print(f"   results appended to {args.output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,6 @@
-from tests.tokenizer import Tokenizer
+from tests.tokenizer import Tokenizer, load_token_ids
 import numpy as np
 import os
-from tqdm import tqdm
 import time
 
 DATA_PATH = './data/'
@@ -22,33 +21,10 @@ def main():
         file_size_mb = file_size / (1024 * 1024)
         print(f"📁 File size: {file_size_mb:.1f} MB")
         
-        # Read file with progress bar
-        print("📖 Reading file...")
-        with open(dataset_path, 'r') as f:
-            dataset = f.read()
-        
-        print(f"📝 Text length: {len(dataset):,} characters")
-        
-        # Encode with progress bar
-        print("🔤 Tokenizing...")
+        # Encode in parallel, sharded on <|endoftext|> so no pre-token is ever split
+        print(f"🔤 Tokenizing with {os.cpu_count()} workers...")
         start_time = time.time()
-        
-        # For very large files, we can process in chunks
-        if len(dataset) > 1000000:  # 1M characters
-            print("📊 Large file detected, processing in chunks...")
-            chunk_size = 500000  # 500K characters per chunk
-            chunks = [dataset[i:i+chunk_size] for i in range(0, len(dataset), chunk_size)]
-            
-            token_ids = []
-            for i, chunk in enumerate(tqdm(chunks, desc="Processing chunks", unit="chunk")):
-                chunk_tokens = tokenizer.encode(chunk)
-                token_ids.extend(chunk_tokens)
-                
-                # Update progress description
-                tqdm.write(f"Chunk {i+1}/{len(chunks)}: {len(chunk_tokens):,} tokens")
-        else:
-            # Small file, process directly
-            token_ids = tokenizer.encode(dataset)
+        token_ids = tokenizer.encode_file(dataset_path, num_workers=os.cpu_count())
         
         encoding_time = time.time() - start_time
         
@@ -57,13 +33,13 @@ def main():
         token_ids = np.array(token_ids, dtype=np.uint16)
         
         # Calculate statistics
-        compression_ratio = len(dataset.encode('utf-8')) / len(token_ids)
+        compression_ratio = file_size / len(token_ids)
         tokens_per_second = len(token_ids) / encoding_time
         
         print(f"\n📊 Encoding Statistics:")
         print(f"   ⏱️  Time: {encoding_time:.2f} seconds")
         print(f"   🚀 Speed: {tokens_per_second:,.0f} tokens/second")
-        print(f"   📏 Input: {len(dataset):,} characters")
+        print(f"   📏 Input: {file_size:,} bytes")
         print(f"   🎯 Output: {len(token_ids):,} tokens")
         print(f"   📦 Shape: {token_ids.shape}")
         print(f"   🗜️  Compression: {compression_ratio:.2f} bytes/token")
@@ -77,6 +53,30 @@ def main():
         
         return token_ids
     
+    def stream_encode_dataset(dataset_path):
+        """Stream-encode a dataset straight to disk, keeping memory constant regardless of corpus size"""
+        print(f"\n🔄 Stream encoding: {os.path.basename(dataset_path)}")
+        file_size = os.path.getsize(dataset_path)
+        output_path = DATA_PATH + os.path.basename(dataset_path) + '_token_ids.bin'
+        
+        start_time = time.time()
+        with open(dataset_path, 'r') as f:
+            num_tokens = tokenizer.encode_to_file(f, output_path)
+        encoding_time = time.time() - start_time
+        
+        token_ids = load_token_ids(output_path)
+        print("\n📊 Encoding Statistics:")
+        print(f"   ⏱️  Time: {encoding_time:.2f} seconds")
+        print(f"   🚀 Speed: {num_tokens / encoding_time:,.0f} tokens/second")
+        print(f"   🎯 Output: {num_tokens:,} tokens ({token_ids.dtype})")
+        print(f"   🗜️  Compression: {file_size / num_tokens:.2f} bytes/token")
+        print(f"✅ Saved to: {output_path}")
+        
+        return token_ids
+    
+    # OpenWebText is too large to hold as a list of ints, stream it to disk instead
+    # stream_encode_dataset(DATA_PATH + 'owt_train.txt')
+    
     # encode_dataset(DATA_PATH + 'TinyStoriesV2-GPT4-valid.txt')
     # print("TinyStoriesV2-GPT4-valid.txt encoded")
     
@@ -1,7 +1,11 @@
 import cProfile
+import heapq
 import pstats
 import io
+import time
+import regex as re
 from tests.common import FIXTURES_PATH
+from tests.constants import PAT
 from tests.test_tokenizer import get_tokenizer_from_vocab_merges_path
 
 VOCAB_PATH = FIXTURES_PATH / "gpt2_vocab.json"
@@ -32,6 +36,112 @@ def benchmark_tokenizer():
         print(f"Output tokens: {len(encoded)} tokens")
         print(f"Compression: {len(text.encode('utf-8')) / len(encoded):.2f} bytes/token")
 
+def bytes_merge_bpe(tokenizer, merge_ranks, token_ids):
+    """
+    Reference merge loop that resolves every pair through bytes, i.e. concatenates the two
+    byte strings and looks the result up in `reverse_vocab`. Used to measure the saving of
+    the integer (left_id, right_id) -> (rank, merged_id) table in `Tokenizer._merge_bpe`.
+    """
+    vocab, reverse_vocab = tokenizer.vocab, tokenizer.reverse_vocab
+    n = len(token_ids)
+    if n < 2:
+        return token_ids
+    ids = token_ids
+    prev_pos = list(range(-1, n - 1))
+    next_pos = list(range(1, n + 1))
+    next_pos[-1] = -1
+
+    def pair_rank(left, right):
+        left_bytes, right_bytes = vocab[left], vocab[right]
+        rank = merge_ranks.get((left_bytes, right_bytes))
+        if rank is None or (left_bytes + right_bytes) not in reverse_vocab:
+            return None
+        return rank
+
+    heap = [(pair_rank(ids[i], ids[i + 1]), i, ids[i], ids[i + 1]) for i in range(n - 1)]
+    heap = [entry for entry in heap if entry[0] is not None]
+    heapq.heapify(heap)
+    while heap:
+        _, i, left, right = heapq.heappop(heap)
+        j = next_pos[i]
+        if ids[i] != left or j == -1 or ids[j] != right:
+            continue
+        ids[i] = reverse_vocab[vocab[left] + vocab[right]]
+        ids[j] = -1
+        k = next_pos[j]
+        next_pos[i] = k
+        if k != -1:
+            prev_pos[k] = i
+            rank = pair_rank(ids[i], ids[k])
+            if rank is not None:
+                heapq.heappush(heap, (rank, i, ids[i], ids[k]))
+        h = prev_pos[i]
+        if h != -1:
+            rank = pair_rank(ids[h], ids[i])
+            if rank is not None:
+                heapq.heappush(heap, (rank, h, ids[h], ids[i]))
+    merged_ids = []
+    i = 0
+    while i != -1:
+        merged_ids.append(ids[i])
+        i = next_pos[i]
+    return merged_ids
+
+
+def benchmark_merge_engine():
+    """Compare the integer pair table merge loop against the bytes-based one, bypassing the merge cache"""
+    tokenizer = get_tokenizer_from_vocab_merges_path(
+        vocab_path=VOCAB_PATH,
+        merges_path=MERGES_PATH,
+        special_tokens=['<|endoftext|>']
+    )
+    with open(FIXTURES_PATH / "tinystories_sample.txt") as f:
+        text = f.read()
+    byte_ids = tokenizer._byte_ids
+    pre_tokens = [[byte_ids[b] for b in pre_token.encode('utf-8')] for pre_token in re.findall(PAT, text)]
+    merge_ranks = {merge: rank for rank, merge in enumerate(tokenizer.merges)}
+
+    print(f"\n--- Merge engine: {len(pre_tokens)} pre-tokens ---")
+    start = time.perf_counter()
+    bytes_ids = [bytes_merge_bpe(tokenizer, merge_ranks, list(token_ids)) for token_ids in pre_tokens]
+    bytes_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    int_ids = [tokenizer._merge_bpe(list(token_ids)) for token_ids in pre_tokens]
+    int_time = time.perf_counter() - start
+
+    assert bytes_ids == int_ids, "Merge engines disagree"
+    print(f"bytes pairs: {bytes_time * 1e6 / len(pre_tokens):.2f} us/pre-token")
+    print(f"int pairs:   {int_time * 1e6 / len(pre_tokens):.2f} us/pre-token")
+    print(f"Saved: {100 * (1 - int_time / bytes_time):.1f}% of merge time")
+
+
+def benchmark_encode_iterable():
+    """Compare per-line `encode` against the chunked `encode_iterable_chunks` on the lines of a TinyStories file"""
+    tokenizer = get_tokenizer_from_vocab_merges_path(
+        vocab_path=VOCAB_PATH,
+        merges_path=MERGES_PATH,
+        special_tokens=['<|endoftext|>']
+    )
+    with open(FIXTURES_PATH / "tinystories_sample.txt") as f:
+        lines = f.readlines() * 200
+    num_mb = sum(len(line.encode('utf-8')) for line in lines) / 2**20
+    num_tokens = sum(chunk.size for chunk in tokenizer.encode_iterable_chunks(lines))  # also warms the cache
+
+    print(f"\n--- encode_iterable: {len(lines)} lines, {num_mb:.1f}MB ---")
+    start = time.perf_counter()
+    per_line_ids = [token_id for line in lines for token_id in tokenizer.encode(line)]
+    per_line_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chunks = list(tokenizer.encode_iterable_chunks(lines))
+    chunked_time = time.perf_counter() - start
+
+    assert sum(chunk.size for chunk in chunks) == num_tokens
+    print(f"per-line encode: {len(per_line_ids) / per_line_time:,.0f} tokens/s ({num_mb / per_line_time:.2f}MB/s)")
+    print(f"chunked:         {num_tokens / chunked_time:,.0f} tokens/s ({num_mb / chunked_time:.2f}MB/s)")
+
+
 def main():
     """Main function with profiling"""
     print("Starting tokenizer benchmark with profiling...")
@@ -43,6 +153,9 @@ def main():
     benchmark_tokenizer()
     
     profiler.disable()
+
+    benchmark_merge_engine()
+    benchmark_encode_iterable()
     
     # Print overall profiling results
     print("\n" + "="*60)
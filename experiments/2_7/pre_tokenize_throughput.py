@@ -0,0 +1,32 @@
+import regex as re
+from tests.common import FIXTURES_PATH, best_of
+from tests.constants import PAT
+from tests.pretokenizer import find_pre_tokens
+
+PAT_RE = re.compile(PAT)
+
+
+def main():
+    """Compare regex.findall(PAT) with find_pre_tokens' ASCII fast path on ASCII, mostly-ASCII and non-ASCII text"""
+    tinystories = (FIXTURES_PATH / "tinystories_sample.txt").read_text(encoding="utf-8")
+    texts = {
+        "TinyStories (ASCII)": "".join(char for char in tinystories if char.isascii()) * 50,
+        "TinyStories": tinystories * 50,
+        "corpus.en": (FIXTURES_PATH / "corpus.en").read_text(encoding="utf-8") * 10,
+        "german.txt": (FIXTURES_PATH / "german.txt").read_text(encoding="utf-8") * 200,
+    }
+    print("=" * 60)
+    print("PRE-TOKENIZATION THROUGHPUT")
+    print("=" * 60)
+    print(f"   {'text':<22} {'size':>8} {'regex PAT':>12} {'fast path':>12} {'speedup':>8}")
+    for name, text in texts.items():
+        assert find_pre_tokens(text) == PAT_RE.findall(text)
+        size_mb = len(text.encode("utf-8")) / 2**20
+        regex_time = best_of(lambda text=text: PAT_RE.findall(text))
+        fast_time = best_of(lambda text=text: find_pre_tokens(text))
+        print(f"   {name:<22} {size_mb:>6.1f}MB {size_mb / regex_time:>8.1f}MB/s {size_mb / fast_time:>8.1f}MB/s"
+              f" {regex_time / fast_time:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
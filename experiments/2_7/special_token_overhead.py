@@ -0,0 +1,64 @@
+import timeit
+import regex as re
+from tests.common import FIXTURES_PATH
+from tests.constants import PAT
+from tests.pretokenizer import find_pre_tokens
+from tests.test_tokenizer import get_tokenizer_from_vocab_merges_path
+
+VOCAB_PATH = FIXTURES_PATH / "gpt2_vocab.json"
+MERGES_PATH = FIXTURES_PATH / "gpt2_merges.txt"
+PAT_RE = re.compile(PAT)
+
+
+def legacy_split_and_preserve_special_tokens(text, special_tokens):
+    """The per-call special token split `Tokenizer.encode` used before the pattern was precompiled"""
+    sorted_special_tokens = sorted(special_tokens, key=len, reverse=True)
+    pattern = f"({'|'.join(map(re.escape, sorted_special_tokens))})"
+    parts = re.split(pattern, text)
+    return [part for part in parts if part]
+
+
+def main():
+    """Measure the per-call special token and pre-tokenization overhead of encoding short strings"""
+    special_tokens = ["<|endoftext|>", "<|endoftext|><|endoftext|>"]
+    tokenizer = get_tokenizer_from_vocab_merges_path(
+        vocab_path=VOCAB_PATH,
+        merges_path=MERGES_PATH,
+        special_tokens=special_tokens,
+    )
+    test_texts = {
+        "short, no special token": "Hello, how are you?",
+        "short, with special token": "Hello<|endoftext|>how are you?",
+    }
+    number = 100_000
+
+    print("=" * 60)
+    print("SPECIAL TOKEN OVERHEAD PER CALL")
+    print("=" * 60)
+    for name, text in test_texts.items():
+        tokenizer.encode(text)  # warm up the merge cache
+        legacy = timeit.timeit(
+            lambda text=text: [
+                chunk if chunk in special_tokens else PAT_RE.findall(chunk)
+                for chunk in legacy_split_and_preserve_special_tokens(text, special_tokens)
+            ],
+            number=number,
+        )
+
+        # the path `encode` takes: skip the scan when no special token can occur, else scan in one pass
+        def current_pre_tokenize(text=text):
+            if tokenizer._may_contain_special_token(text):
+                return list(tokenizer.pre_tokenizer.stretches(text))
+            return find_pre_tokens(text)
+
+        current = timeit.timeit(current_pre_tokenize, number=number)
+        encode = timeit.timeit(lambda text=text: tokenizer.encode(text), number=number)
+
+        print(f"\n📝 {name}: {text!r}")
+        print(f"   Split, then pre-tokenize: {legacy * 1e6 / number:.2f} us/call")
+        print(f"   Single-pass stretches:    {current * 1e6 / number:.2f} us/call")
+        print(f"   Full encode:              {encode * 1e6 / number:.2f} us/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import os
+import pickle
+import tempfile
+from tests.common import FIXTURES_PATH, best_of
+from tests.test_tokenizer import get_tokenizer_from_vocab_merges_path
+from tests.tokenizer import Tokenizer
+
+VOCAB_PATH = FIXTURES_PATH / "gpt2_vocab.json"
+MERGES_PATH = FIXTURES_PATH / "gpt2_merges.txt"
+SAMPLE_TEXT = "Once upon a time, there was a little girl named Lily.<|endoftext|>"
+
+
+def main():
+    """Compare tokenizer startup time of the JSON, pickle and binary loaders"""
+    special_tokens = ['<|endoftext|>']
+    tokenizer = get_tokenizer_from_vocab_merges_path(
+        vocab_path=VOCAB_PATH,
+        merges_path=MERGES_PATH,
+        special_tokens=special_tokens,
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        vocab_pickle_path = os.path.join(tmp_dir, "vocab.pkl")
+        merges_pickle_path = os.path.join(tmp_dir, "merges.pkl")
+        binary_path = os.path.join(tmp_dir, "gpt2.bpe")
+        with open(vocab_pickle_path, "wb") as f:
+            pickle.dump(tokenizer.vocab, f)
+        with open(merges_pickle_path, "wb") as f:
+            pickle.dump(tokenizer.merges, f)
+        tokenizer.save(binary_path)
+
+        loaders = {
+            "JSON + merges.txt": lambda: get_tokenizer_from_vocab_merges_path(
+                vocab_path=VOCAB_PATH, merges_path=MERGES_PATH, special_tokens=special_tokens
+            ),
+            "pickle (from_files)": lambda: Tokenizer.from_files(vocab_pickle_path, merges_pickle_path, special_tokens),
+            "binary (load)": lambda: Tokenizer.load(binary_path),
+        }
+        print("=" * 60)
+        print("TOKENIZER STARTUP TIME")
+        print("=" * 60)
+        # `load` defers the vocab, merges and pair table to first use, so also time the first encode
+        print(f"   {'':<22} {'load':>11} {'+ encode':>11}")
+        for name, load in loaders.items():
+            print(f"   {name:<22} {best_of(load) * 1000:8.1f} ms"
+                  f" {best_of(lambda load=load: load().encode(SAMPLE_TEXT)) * 1000:8.1f} ms")
+        print(f"   binary file size: {os.path.getsize(binary_path) / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -34,5 +34,16 @@ def main():
     print("decoded_text:", decoded_text)
     assert decoded_text == sample_text, "Decoded text does not match the original."
 
+    # Stream the tokens one at a time, as during generation: decoding each id on its own would
+    # print replacement characters, the incremental decoder waits until the character is complete
+    decoder = tokenizer.incremental_decoder()
+    streamed_text = ""
+    for token_id in encoded:
+        piece = decoder.decode(token_id)
+        print(f"streamed {token_id}: {piece!r} (decoded alone: {tokenizer.decode([token_id])!r})")
+        streamed_text += piece
+    streamed_text += decoder.flush()
+    assert streamed_text == sample_text, "Streamed text does not match the original."
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
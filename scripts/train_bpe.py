@@ -1,5 +1,7 @@
 import argparse
 from tests.adapters import run_train_bpe
+from tests.train_bpe import TrainStats
+import json
 import pickle
 
 def main():
@@ -16,12 +18,27 @@ def main():
                         help="List of special tokens to be included in the vocabulary.")
     parser.add_argument("--output_path", type=str, default="./data/my_ts_data", 
                         help="Path to save the BPE vocabulary and merges.")
+    parser.add_argument("--pre_token_cache_dir", type=str, default=None,
+                        help="Directory caching the pre-token counts across runs on the same file.")
+    parser.add_argument("--checkpoint_path", type=str, default=None,
+                        help="Path to checkpoint the trainer state, an existing checkpoint is resumed.")
+    parser.add_argument("--checkpoint_every", type=int, default=1000, help="Number of merges between checkpoints.")
+    parser.add_argument("--progress", action="store_true", help="Show a progress bar of the merges.")
+    parser.add_argument("--stats_path", type=str, default=None,
+                        help="Path to save the timings and counters of the run as JSON.")
     args = parser.parse_args()
 
+    stats = TrainStats()
+
     vocab, merges = run_train_bpe(
         input_path=args.input_path,
         vocab_size=args.vocab_size,
         special_tokens=args.special_tokens,
+        pre_token_cache_dir=args.pre_token_cache_dir,
+        checkpoint_path=args.checkpoint_path,
+        checkpoint_every=args.checkpoint_every,
+        stats=stats,
+        progress=args.progress,
     )
 
     print("Vocabulary size:", len(vocab))
@@ -29,6 +46,10 @@ def main():
 
     print("Number of merges:", len(merges))
     print("Sample merges:", merges[:10])
+    print(stats)
+    if args.stats_path is not None:
+        with open(args.stats_path, "w") as f:
+            json.dump(stats.as_dict(), f, indent=2)
 
     
     bpe_data = {
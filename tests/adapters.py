@@ -1,9 +1,7 @@
 from __future__ import annotations
 
 import os
-import regex as re
 
-from collections import defaultdict
 from typing import IO, Any, BinaryIO
 from collections.abc import Iterable
 from jaxtyping import Float, Int
@@ -13,7 +11,7 @@ import torch
 from torch import Tensor
 
 from tests.tokenizer import Tokenizer
-from tests.constants import PAT
+from tests.train_bpe import BPETrainer, TrainStats, _pre_token_cache_key, count_pre_tokens
 
 
 def run_linear(
@@ -588,6 +586,22 @@ def run_train_bpe(
             These strings will never be split into multiple tokens, and will always be
             kept as a single token. If these special tokens occur in the `input_path`,
             they are treated as any other string.
+        num_workers (int, optional): Number of processes used for pre-tokenization, defaults to the number of CPUs.
+        pre_token_cache_dir (str | os.PathLike, optional): Directory caching the pre-token counts, so that
+            repeated runs on the same file and special tokens skip pre-tokenization.
+        hash_content (bool, optional): Identify the input file in that cache by a hash of its content
+            instead of its mtime, defaults to False.
+        warm_start (tuple[dict[int, bytes], list[tuple[bytes, bytes]]], optional): The (vocab, merges) of an
+            earlier run on the same corpus and special tokens. Its merges are replayed instead of being
+            searched for again, and training continues from there up to `vocab_size`.
+        checkpoint_path (str | os.PathLike, optional): Where to checkpoint the trainer state. If the file
+            already exists, training resumes from it instead of starting over. The checkpoint must come from
+            the same input file (with the same size and mtime, or content with `hash_content`) and special
+            tokens, and hold at most `vocab_size` tokens, else a ValueError is raised. The final checkpoint
+            of a finished run is kept, marked complete, and can be resumed to extend the run.
+        checkpoint_every (int, optional): Number of merges between two checkpoints, defaults to 1000.
+        stats (TrainStats, optional): Filled in with the timings and counters of every phase of the run.
+        progress (bool, optional): Show a tqdm progress bar of the merges, defaults to False.
 
     Returns:
         tuple[dict[int, bytes], list[tuple[bytes, bytes]]]:
@@ -599,120 +613,52 @@ def run_train_bpe(
                 representing that <token1> was merged with <token2>.
                 Merges are ordered by order of creation.
     """
-    # init the vocabulary bytes
-    INIT_VOCAB_SIZE = 256  # initial vocabulary size
-
-    def build_vocab(special_tokens, init_vocab_size):
-        """
-        LEARNING:
-        1. Build the initial vocab with the first 256 bytes PULS the special tokens encoded in bytestring.
-        2. The special tokens are added first, and then the first 256 bytes are added.
-        """
-        vocab = {}  # type: dict[int, bytes]
-        idx = 0
-        # add special tokens to the vocab
-        for token in special_tokens:
-            vocab[idx] = token.encode("utf-8")  # encode the special token to bytes
-            idx += 1
-        # add the first 256 bytes to the vocab
-        for i in range(init_vocab_size):
-            vocab[idx] = bytes([i])
-            idx += 1
-        return vocab
-    
-    vocab = build_vocab(special_tokens, INIT_VOCAB_SIZE)
-    # pre-tokenization
-    with open(input_path, "r", encoding="utf-8") as f:
-        # read the entire file as text
-        raw_text = f.read()
-    # split the text into chunks based on the special tokens
-    chunks = re.split("|".join(map(re.escape, special_tokens)), raw_text)
-    # pre-tokenize each chunk
-    
-    combined_pre_tokens = []
-    for chunk in chunks:
-        pre_tokens = re.findall(PAT, chunk)
-        combined_pre_tokens.extend(pre_tokens)    
-
-    pre_tokens_in_byte = [pre_token.encode("utf-8") for pre_token in combined_pre_tokens]
-    
-    pre_token_frequency = defaultdict(int)
-    for byte_token in pre_tokens_in_byte:
-        pre_token_frequency[byte_token] += 1
-    
-    """
-    output pre-tokens:
-    [b'u', b' don', b"'t", b' have', b' to', b' be', b' scared', b' of', b' the', b' loud']
-    """
-
-    # tuple the tokens with their frequencies
-    tupled_byte_token_frequency = {}
-    for pre_token, frequency in pre_token_frequency.items():
-        tupled_byte_tokens = tuple(bytes([b]) for b in pre_token) # must wrap the bytes in a tuple
-        tupled_byte_token_frequency[tupled_byte_tokens] = frequency
-    
-    """
-    output tupled byte tokens:
-    [(b'u',), (b' ', b'd', b'o', b'n'), (b"'", b't'), (b' ', b'h', b'a', b'v', b'e'), (b' ', b't', b'o')]
-    this is the starting point for the BPE merges
-    """
-    
-    merges = [] # list to store the merges
-    
-    while len(vocab) < vocab_size:
-            # iterate thru the adjacent byte tokens and merge them
-        def get_stats(freq_vocab): 
-            pairs = defaultdict(int) 
-            for symbols, freq in freq_vocab.items(): 
-                for i in range(len(symbols)-1): 
-                    assert (symbols[i] != b"" or symbols[i+1] != b"") # ensure that the symbols are not empty
-                    pairs[(symbols[i],symbols[i+1])] += freq
-            return pairs
-        
-        def merge_tokens(freq_vocab, pair): 
-            # this is the learning/training process for the BPE tokenizer
-            new_freq_vocab = defaultdict(int)
-            """
-            LEARNING: 
-            1. operate with b"..." as prefix for bytes strings, instead of str, since the tokens are in bytes
-            2. never use token.decode or encode with utf-8, since not all byte sequences are valid utf-8 
-            """
-            for tokens, freq in freq_vocab.items():
-                # print(f"old token tuple: {tokens}")
-                """
-                LEARNING:
-                1. Ths merge function must take care of the leading spaces very carefully, since in the pre-tokenization step, words are split by spaces, and the leading space is kept, e.g 
-                    "the cat ate" --> pre-tokenization --> [b'the', b' cat', b' ate']
-                2. the key of the freq_vocab always preserve the tuple of byte tokens (aka each item in the tuple must be a valid token (in byte space) before/after merging).
-                """
-                merged = []
-                i = 0
-                while i < len(tokens):
-                    if i < len(tokens) - 1 and (tokens[i], tokens[i + 1]) == pair:
-                        merged.append(tokens[i] + tokens[i + 1])
-                        i += 2
-                    else:
-                        merged.append(tokens[i])
-                        i += 1
-                new_token_tuple = tuple(merged)  # convert the merged tokens back to a tuple of bytes
-                # print(f"new token tuple: {new_token_tuple}")
-                new_freq_vocab[new_token_tuple] += freq
-            return new_freq_vocab
-    
-        # get the stats of the tupled byte token frequency
-        pairs = get_stats(tupled_byte_token_frequency)
-        # get the max pair 
+    stats = kwargs.get("stats")
+    if stats is None:
+        stats = TrainStats()
+    checkpoint_path = kwargs.get("checkpoint_path")
+    pre_token_cache_dir = kwargs.get("pre_token_cache_dir")
+    # computed once for the checkpoint and the pre-token cache, with `hash_content` it reads the whole file
+    input_fingerprint = (
+        _pre_token_cache_key(input_path, special_tokens, kwargs.get("hash_content", False))
+        if checkpoint_path is not None or pre_token_cache_dir is not None
+        else None
+    )
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        # resume an interrupted (or extend a complete) run on the same corpus, the pre-tokens and pair index
+        # are restored from the checkpoint
+        trainer = BPETrainer.from_checkpoint(checkpoint_path, special_tokens, input_fingerprint)
+        trainer.stats = stats
+    else:
+        # pre-tokenization, counted in parallel over byte ranges of the file
+        pre_token_frequency = count_pre_tokens(
+            input_path,
+            special_tokens,
+            num_workers=kwargs.get("num_workers"),
+            cache_dir=pre_token_cache_dir,
+            hash_content=kwargs.get("hash_content", False),
+            stats=stats,
+            cache_key=input_fingerprint,
+        )
         """
-        LEARNING:
-        1. max/min with key= is to extract the comparision key from the iterable, in this case, the frequency of the pairs
-        2. make sure to return the pair with greater lexicographic order 
+        output pre-tokens:
+        [b'u', b' don', b"'t", b' have', b' to', b' be', b' scared', b' of', b' the', b' loud']
         """
-        max_value = max(pairs.values())
-        max_pairs = [k for k, v in pairs.items() if v == max_value]
-        max_pair = max(max_pairs, key=lambda x: (x[0], x[1]))
-        
-        tupled_byte_token_frequency = merge_tokens(tupled_byte_token_frequency, max_pair)
-        merges.append(max_pair)
-        vocab[len(vocab)] = b"".join(max_pair) # append new token in the vocab
-
-    return vocab, merges  # Placeholder for merges, as the implementation is not provided
+        trainer = BPETrainer(pre_token_frequency, special_tokens, stats=stats, input_fingerprint=input_fingerprint)
+        warm_start = kwargs.get("warm_start")
+        if warm_start is not None:
+            # continue from the (vocab, merges) of a smaller run on the same corpus
+            init_vocab, init_merges = warm_start
+            trainer.replay(init_merges)
+            if trainer.vocab != init_vocab:
+                raise ValueError("warm_start vocab was not trained with these special tokens.")
+
+    # learn the merges, each merge only re-counts the pre-tokens that contain the merged pair
+    vocab, merges = trainer.train(
+        vocab_size,
+        checkpoint_path=checkpoint_path,
+        checkpoint_every=kwargs.get("checkpoint_every", 1000),
+        progress=kwargs.get("progress", False),
+    )
+
+    return vocab, merges
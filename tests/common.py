@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 import pathlib
+import time
+from collections.abc import Callable
 from functools import lru_cache
 
 FIXTURES_PATH = (pathlib.Path(__file__).resolve().parent) / "fixtures"
@@ -52,3 +54,15 @@ def gpt2_bytes_to_unicode() -> dict[int, str]:
     characters = [chr(n) for n in cs]
     d = dict(zip(bs, characters))
     return d
+
+
+def best_of(fn: Callable[[], object], repeats: int = 5) -> float:
+    """
+    Best wall time, in seconds, of `repeats` calls of `fn`. Shared by the benchmarks under `experiments/`.
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
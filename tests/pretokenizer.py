@@ -0,0 +1,283 @@
+from .constants import PAT
+from typing import Iterator
+import re as std_re
+import regex as re
+
+_PAT_RE = re.compile(PAT)
+
+# PAT restricted to ASCII text, for the (much faster) stdlib `re` engine. On ASCII, `regex`'s \s, \p{L}
+# and \p{N} are exactly [\t\n\x0b\x0c\r ], [A-Za-z] and [0-9] (stdlib's \s would also match \x1c-\x1f).
+# The letter, number and punctuation runs are never backtracked into, so they can be possessive.
+ASCII_PAT = (
+    r"""'(?:[sdmt]|ll|ve|re)| ?[A-Za-z]++| ?[0-9]++| ?[^\t\n\x0b\x0c\r A-Za-z0-9]++"""
+    r"""|[\t\n\x0b\x0c\r ]+(?![^\t\n\x0b\x0c\r ])|[\t\n\x0b\x0c\r ]+"""
+)
+_ASCII_PAT_RE = std_re.compile(ASCII_PAT)
+_MIN_ASCII_RUN = 256  # shortest run of ASCII characters worth switching to the ASCII engine
+# a run of `_MIN_ASCII_RUN` ASCII characters contains a whole block of this many, aligned on any grid
+_ASCII_BLOCK = _MIN_ASCII_RUN // 2
+_NON_ASCII_RE = std_re.compile(r"[^\x00-\x7f]")
+# characters of text pre-tokenized into one list by `PreTokenizer.stretches`, so a long text without special
+# tokens is not materialized as a list of all its pre-tokens at once
+_MAX_STRETCH = 2**16
+
+
+# Positions where a text can be cut without changing its pre-tokens: a pre-token ends there, and `PAT` (which
+# has no lookbehind) finds the same pre-tokens on either side as in the whole text. That is the case
+# - before a single space between two non-whitespace characters (the space starts the next pre-token),
+# - after any other single whitespace character between two non-whitespace characters,
+# - between two non-whitespace characters of different classes (letter, number, other), except after
+#   an apostrophe, which may start a contraction such as "'s".
+# Only positive lookarounds are used, so cutting the searched text short can hide a cut but never invent one.
+CUT_PAT = (
+    r"""(?<=\S)(?= \S)|(?<=\S[^\S ])(?=\S)|(?<=\p{L})(?=[^\s\p{L}])|(?<=\p{N})(?=[^\s\p{N}])"""
+    r"""|(?<=[^\s\p{L}\p{N}'])(?=[\p{L}\p{N}])"""
+)
+_CUT_RE = re.compile(CUT_PAT)
+_REVERSE_CUT_RE = re.compile(CUT_PAT, re.REVERSE)
+
+
+def _first_cut(text: str, start: int, end: int, endpos: int) -> int:
+    """
+    First cut position in text[start:end + 1] of the text that ends at `endpos`, or -1.
+    """
+    match = _CUT_RE.search(text, start, min(end + 2, endpos))
+    return match.start() if match is not None and match.start() <= end else -1
+
+
+def _last_cut(text: str, start: int, end: int, endpos: int) -> int:
+    """
+    Last cut position in text[start:end + 1] of the text that ends at `endpos`, or -1.
+    """
+    for match in _REVERSE_CUT_RE.finditer(text, max(start - 2, 0), min(end + 2, endpos)):
+        if match.start() <= end:
+            return match.start() if match.start() >= start else -1
+    return -1
+
+
+def _bounded(text: str, pos: int, endpos: int) -> Iterator[tuple[int, int]]:
+    """
+    Cut text[pos:endpos] at cut positions into parts of about `_MAX_STRETCH` characters (or longer where
+    there is no cut).
+    """
+    while endpos - pos > _MAX_STRETCH:
+        cut = _first_cut(text, pos + _MAX_STRETCH, endpos - 1, endpos)
+        if cut == -1:
+            break
+        yield pos, cut
+        pos = cut
+    yield pos, endpos
+
+
+def _find_ascii_run(text: str, pos: int, endpos: int) -> tuple[int, int] | None:
+    """
+    Span of the first run of at least `_MIN_ASCII_RUN` ASCII characters in text[pos:endpos], or None.
+
+    Only blocks of `_ASCII_BLOCK` characters on a grid are tested (`isascii` is O(1) on a slice with
+    non-ASCII characters) and a block that is all ASCII is extended to its run, so text dense in
+    non-ASCII characters is not scanned character by character.
+    """
+    start = pos
+    while start + _ASCII_BLOCK <= endpos:
+        if not text[start:start + _ASCII_BLOCK].isascii():
+            start += _ASCII_BLOCK
+            continue
+        # the blocks before were not all ASCII, so the run starts less than a block before this one
+        before = text[max(pos, start - _ASCII_BLOCK):start][::-1]
+        non_ascii = _NON_ASCII_RE.search(before)
+        run_start = start - (non_ascii.start() if non_ascii is not None else len(before))
+        non_ascii = _NON_ASCII_RE.search(text, start + _ASCII_BLOCK, endpos)
+        run_end = non_ascii.start() if non_ascii is not None else endpos
+        if run_end - run_start >= _MIN_ASCII_RUN:
+            return run_start, run_end
+        start += (run_end - start) // _ASCII_BLOCK * _ASCII_BLOCK + _ASCII_BLOCK
+    return None
+
+
+def _segments(text: str, pos: int, endpos: int) -> Iterator[tuple[std_re.Pattern, int, int]]:
+    """
+    Cut text[pos:endpos] at safe points into runs of at least `_MIN_ASCII_RUN` ASCII characters, matched
+    with the ASCII pattern, and the stretches in between, matched with `PAT`. Text dense in non-ASCII
+    characters stays a single `PAT` stretch.
+    """
+    if text.isascii():  # O(1) for str
+        yield _ASCII_PAT_RE, pos, endpos
+        return
+    search = pos
+    while True:
+        run = _find_ascii_run(text, search, endpos)
+        if run is None:
+            break
+        run_start, run_end = run
+        search = run_end
+        # the ASCII stretch goes from the first to the last cut of the run (or to the ends of the text)
+        start = pos if run_start == pos else _first_cut(text, max(run_start, pos + 1), run_end, endpos)
+        end = endpos if run_end == endpos else _last_cut(text, start + 1, run_end, endpos)
+        if start == -1 or end == -1:
+            continue
+        if pos < start:
+            yield _PAT_RE, pos, start
+        yield _ASCII_PAT_RE, start, end
+        pos = end
+    if pos < endpos:
+        yield _PAT_RE, pos, endpos
+
+
+def find_pre_tokens(text: str, pos: int = 0, endpos: int | None = None) -> list[str]:
+    """
+    Same as `regex.findall(PAT, text, pos, endpos)`, but ASCII text is matched by the stdlib `re` engine
+    with `ASCII_PAT`, which avoids evaluating the Unicode classes of `PAT`.
+    """
+    endpos = len(text) if endpos is None else min(endpos, len(text))
+    if text.isascii():
+        return _ASCII_PAT_RE.findall(text, pos, endpos)
+    pre_tokens = []
+    for pattern, start, end in _segments(text, pos, endpos):
+        pre_tokens += pattern.findall(text, start, end)
+    return pre_tokens
+
+
+def is_shard_token(token: str, special_tokens: list[str]) -> bool:
+    """
+    Whether a file can be cut into parts at occurrences of `token`: it is one of the special tokens and no longer
+    special token contains it, so the text on either side of it is pre-tokenized separately anyway.
+    """
+    return bool(token) and token in special_tokens and not any(
+        token in other and token != other for other in special_tokens
+    )
+
+
+def translate_newlines(text: str) -> str:
+    """
+    Universal newline translation, as when a file is read in text mode.
+    """
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def _pre_token_spans(text: str, pos: int, endpos: int) -> Iterator[tuple[int, int]]:
+    for pattern, start, end in _segments(text, pos, endpos):
+        for match in pattern.finditer(text, start, end):
+            yield match.span()
+
+
+class PreTokenizer(object):
+    """
+    Single-pass scanner that cuts a text into special tokens and `PAT` pre-tokens.
+
+    Instead of splitting the text on the special tokens and running `PAT` over every part, the scanner
+    walks the special-token matches and runs `PAT` bounded by `pos` and `endpos` over the text between
+    two of them. No part of the text is copied, and the pieces are produced lazily, one stretch between
+    two special tokens at a time (`findall` is used for each stretch, it is much faster than creating
+    a match object per pre-token). ASCII text goes through `find_pre_tokens`' faster ASCII engine.
+
+    Bounding `PAT` by `endpos` (rather than matching special tokens and pre-tokens with one combined
+    pattern) matters: `PAT` sees the text before a special token as if the text ended there, so e.g.
+    `\\s+(?!\\S)` matches the same whitespace as when that part was split off.
+
+    A pre-token never contains a whole special token, so a piece is a special token exactly when it is
+    one of `special_tokens`.
+    """
+
+    def __init__(self, special_tokens: list[str] | None = None):
+        """
+        Args:
+            special_tokens (list[str] | None): Special tokens, matched longest first when they overlap.
+        """
+        self.special_tokens = sorted({token for token in special_tokens or [] if token}, key=len, reverse=True)
+        self._special_re = (
+            re.compile("|".join(map(re.escape, self.special_tokens))) if self.special_tokens else None
+        )
+        # cutting right before a special token is safe too, as long as no other one straddles the cut
+        self._reverse_cut_re = (
+            re.compile(f"{CUT_PAT}|(?=(?:{'|'.join(map(re.escape, self.special_tokens))}))", re.REVERSE)
+            if self.special_tokens
+            else _REVERSE_CUT_RE
+        )
+
+    def last_safe_cut(self, text: str, start: int = 0) -> int:
+        """
+        Last position in text[start:] where `text` can be cut without changing its pieces (see `CUT_PAT`):
+        `stretches` on text[:cut] and on text[cut:] gives the same pieces as on the whole text, and still
+        does whatever text is appended to it later, so it can cut a buffer being streamed. Returns -1 if
+        there is none. Only text[start - 2:] is searched, so a caller appending to a buffer can resume the
+        search where the previous one stopped.
+        """
+        start = max(start, 1)
+        # a special token that is not complete yet could straddle a cut closer to the end
+        end = len(text) - max((len(token) for token in self.special_tokens), default=1) + 1
+        for match in self._reverse_cut_re.finditer(text, max(start - 2, 0)):
+            cut = match.start()
+            if cut > end:
+                continue
+            if cut < start:
+                break
+            if not any(
+                text.find(token, max(cut - len(token) + 1, 0), cut + len(token) - 1) != -1
+                for token in self.special_tokens
+            ):
+                return cut
+        return -1
+
+    def last_forced_cut(self, text: str) -> int:
+        """
+        Last position where a buffer being streamed can be cut without splitting a special token, complete
+        or not, for when `last_safe_cut` finds none. Pre-tokens can be split. Returns -1 if there is none.
+        """
+        # a special token that is not complete yet could straddle a cut closer to the end
+        cut = len(text) - max((len(token) for token in self.special_tokens), default=1) + 1
+        moved = True
+        while moved and cut > 0:
+            moved = False
+            for token in self.special_tokens:
+                position = text.rfind(token, max(cut - len(token) + 1, 0), cut + len(token) - 1)
+                if position != -1:  # the token straddles the cut, cut before it
+                    cut = position
+                    moved = True
+        return cut if cut > 0 else -1
+
+    def spans(self, text: str) -> Iterator[tuple[int, int]]:
+        """
+        Yield the (start, end) span of every special token and pre-token of `text`, in order.
+        """
+        pos = 0
+        if self._special_re is not None:
+            for special in self._special_re.finditer(text):
+                start, end = special.span()
+                if start > pos:
+                    yield from _pre_token_spans(text, pos, start)
+                yield start, end
+                pos = end
+        yield from _pre_token_spans(text, pos, len(text))
+
+    def stretches(self, text: str) -> Iterator[str | list[str]]:
+        """
+        Yield every special token of `text` as a `str` and the pre-tokens between two of them as lists
+        (of at most about `_MAX_STRETCH` characters each), in order.
+        """
+        pos = 0
+        if self._special_re is not None:
+            for special in self._special_re.finditer(text):
+                start = special.start()
+                if start > pos:
+                    for part_start, part_end in _bounded(text, pos, start):
+                        yield find_pre_tokens(text, part_start, part_end)
+                yield special.group()
+                pos = special.end()
+        if pos < len(text):
+            for part_start, part_end in _bounded(text, pos, len(text)):
+                yield find_pre_tokens(text, part_start, part_end)
+
+    def pre_tokens(self, text: str) -> Iterator[str]:
+        """
+        Yield the pre-tokens of `text` in order, leaving out the special tokens (e.g. to count them for training).
+        """
+        pos = 0
+        if self._special_re is not None:
+            for special in self._special_re.finditer(text):
+                start = special.start()
+                if start > pos:
+                    for part_start, part_end in _bounded(text, pos, start):
+                        yield from find_pre_tokens(text, part_start, part_end)
+                pos = special.end()
+        for part_start, part_end in _bounded(text, pos, len(text)):
+            yield from find_pre_tokens(text, part_start, part_end)
@@ -0,0 +1,114 @@
+import random
+
+import regex as re
+
+from .common import FIXTURES_PATH
+from .constants import PAT
+from .pretokenizer import PreTokenizer, find_pre_tokens
+
+SPECIAL_TOKENS = ["<|endoftext|>", "<|endoftext|><|endoftext|>", "<|startoftext|>"]
+
+
+def split_then_findall(text, special_tokens):
+    """Reference pre-tokenization: split on the special tokens (longest first), then run PAT on every part"""
+    special_tokens = sorted(special_tokens, key=len, reverse=True)
+    parts = re.split(f"({'|'.join(map(re.escape, special_tokens))})", text) if special_tokens else [text]
+    pieces = []
+    for part in parts:
+        if part in special_tokens:
+            pieces.append(part)
+        elif part:
+            pieces.extend(re.findall(PAT, part))
+    return pieces
+
+
+def stretch_pieces(pre_tokenizer, text):
+    """Flatten `PreTokenizer.stretches` into the list of special tokens and pre-tokens"""
+    pieces = []
+    for stretch in pre_tokenizer.stretches(text):
+        if isinstance(stretch, str):
+            pieces.append(stretch)
+        else:
+            pieces.extend(stretch)
+    return pieces
+
+
+def test_stretches_match_split_then_findall():
+    texts = [
+        "",
+        "Hello, how are you?",
+        "Héllò hôw <|endoftext|> are ü? 🙃",
+        "trailing space before a special token \n<|endoftext|>next",
+        "  <|endoftext|>  <|endoftext|><|endoftext|>  \n\n<|startoftext|>",
+        "it's they're we'll 42 3.14 !!!<|endoftext|>?",
+        (FIXTURES_PATH / "special_token_double_newlines_non_whitespace.txt").read_text(encoding="utf-8"),
+        (FIXTURES_PATH / "tinystories_sample.txt").read_text(encoding="utf-8"),
+        # longer than `_MAX_STRETCH` without special tokens, pre-tokenized in several lists
+        (FIXTURES_PATH / "tinystories_sample.txt").read_text(encoding="utf-8").replace("<|endoftext|>", "") * 30,
+        "naïve café, 中文！ 42\n\n  x" * 10000,
+    ]
+    for special_tokens in (SPECIAL_TOKENS, ["<|endoftext|>"], []):
+        pre_tokenizer = PreTokenizer(special_tokens)
+        for text in texts:
+            expected = split_then_findall(text, special_tokens)
+            assert stretch_pieces(pre_tokenizer, text) == expected
+            assert [text[start:end] for start, end in pre_tokenizer.spans(text)] == expected
+            assert list(pre_tokenizer.pre_tokens(text)) == [piece for piece in expected if piece not in special_tokens]
+
+
+def random_text(rng, length):
+    """Random text mixing ASCII, Unicode letters, digits and spaces, and the whitespace PAT is picky about"""
+    alphabet = (
+        list("abcXYZ019 .,!?'-_()<|>")
+        + ["'s", "'ll", "'re", "'ve", " '", "  "]
+        + ["\n", "\r\n", "\t", "\x0b", "\x0c", "\x1c", "\x1f", "\x00", "\x7f"]
+        + ["é", "Ü", "ß", "ж", "中文", "٣", "Ⅻ", "²", "\xa0", "\x85", "\u2003", "\u3000", "🙃", "\u200b", "\u0301"]
+        + [" the", " cat", " 42", " é", "<|endoftext|>"]
+    )
+    return "".join(rng.choice(alphabet) for _ in range(length))
+
+
+def test_find_pre_tokens_matches_pat_fuzz():
+    """
+    Differential fuzz test of the ASCII fast path against regex.findall(PAT, ...), on pure ASCII texts,
+    mixed texts long enough to be cut into ASCII and non-ASCII stretches, and pos/endpos bounds.
+    """
+    rng = random.Random(0)
+    pat = re.compile(PAT)
+    for i in range(3000):
+        text = random_text(rng, rng.randint(0, 400))
+        if i % 2 == 0:
+            text = "".join(char for char in text if char.isascii())
+        assert find_pre_tokens(text) == pat.findall(text)
+        pos, endpos = sorted(rng.randint(0, len(text)) for _ in range(2))
+        assert find_pre_tokens(text, pos, endpos) == pat.findall(text, pos, endpos)
+
+    # long stretches of ASCII words with a few non-ASCII characters in between
+    words = ["the", "cat", "x", "42", "!", "it's", "\n", "  ", "naïve", "café", "\u3000", "é"]
+    weights = [1] * 8 + [0.01] * 4
+    for _ in range(200):
+        text = " ".join(rng.choices(words, weights, k=rng.randint(0, 1000)))
+        assert find_pre_tokens(text) == pat.findall(text)
+        assert [text[start:end] for start, end in PreTokenizer().spans(text)] == pat.findall(text)
+
+
+def test_last_forced_cut_keeps_special_tokens():
+    pre_tokenizer = PreTokenizer(SPECIAL_TOKENS)
+    max_length = max(map(len, SPECIAL_TOKENS))
+    rng = random.Random(0)
+    for _ in range(2000):
+        text = random_text(rng, rng.randint(0, 120)) + rng.choice(["", "<|endo", "<|endoftext|><|end", "<|start"])
+        cut = pre_tokenizer.last_forced_cut(text)
+        if cut == -1:
+            continue
+        assert 0 < cut <= len(text) - max_length + 1
+        # the special tokens on both sides, and any completed later, are those of the whole text
+        for suffix in ["", "oftext|>", "text|>"]:
+            full_text = text + suffix
+            specials = [piece for piece in stretch_pieces(pre_tokenizer, full_text) if piece in SPECIAL_TOKENS]
+            assert specials == [
+                piece
+                for part in (full_text[:cut], full_text[cut:])
+                for piece in stretch_pieces(pre_tokenizer, part)
+                if piece in SPECIAL_TOKENS
+            ]
@@ -4,13 +4,17 @@ import json
 import os
 import resource
 import sys
+import tracemalloc
 
+import numpy as np
 import psutil
 import pytest
 import tiktoken
+import torch
 
 from .adapters import get_tokenizer
 from .common import FIXTURES_PATH, gpt2_bytes_to_unicode
+from .tokenizer import MAX_CHUNK_FACTOR, PreTokenCache, Tokenizer, load_token_ids
 
 VOCAB_PATH = FIXTURES_PATH / "gpt2_vocab.json"
 MERGES_PATH = FIXTURES_PATH / "gpt2_merges.txt"
@@ -413,6 +417,290 @@ def test_encode_iterable_tinystories_matches_tiktoken():
     assert reference_tokenizer.decode(reference_ids) == corpus_contents
 
 
+def test_long_pre_tokens_matches_tiktoken():
+    reference_tokenizer = tiktoken.get_encoding("gpt2")
+    tokenizer = get_tokenizer_from_vocab_merges_path(
+        vocab_path=VOCAB_PATH,
+        merges_path=MERGES_PATH,
+    )
+    # whitespace runs, base64-like blobs and minified code produce very long pre-tokens
+    test_string = (
+        " " * 5000
+        + "x"
+        + "aGVsbG8gd29ybGQ" * 400
+        + "\n"
+        + "!==(){};" * 500
+        + "\t\n" * 300
+        + "ab" * 2000
+    )
+    reference_ids = reference_tokenizer.encode(test_string)
+    ids = tokenizer.encode(test_string)
+    assert ids == reference_ids
+    assert tokenizer.decode(ids) == test_string
+
+
+def test_pre_token_cache_lru_eviction():
+    tokenizer = get_tokenizer_from_vocab_merges_path(
+        vocab_path=VOCAB_PATH,
+        merges_path=MERGES_PATH,
+    )
+    tokenizer.cache = PreTokenCache(max_entries=2)
+    ids = tokenizer.encode("the cat the dog the")
+    assert ids == tokenizer.encode("the cat the dog the")
+
+    info = tokenizer.cache_info()
+    assert info.entries == 2
+    assert info.evictions > 0
+    assert info.hits + info.misses == 10
+
+    tokenizer.cache = PreTokenCache(max_entries=None, max_bytes=64)
+    with open(FIXTURES_PATH / "tinystories_sample.txt") as f:
+        corpus_contents = f.read()
+    assert tokenizer.decode(tokenizer.encode(corpus_contents)) == corpus_contents
+    assert tokenizer.cache_info().size_bytes <= 64
+
+
+def test_encode_file_matches_encode(tmp_path):
+    tokenizer = get_tokenizer_from_vocab_merges_path(
+        vocab_path=VOCAB_PATH, merges_path=MERGES_PATH, special_tokens=["<|endoftext|>"]
+    )
+    corpus_path = FIXTURES_PATH / "tinystories_sample.txt"
+    with open(corpus_path) as f:
+        corpus_contents = f.read()
+    ids = tokenizer.encode(corpus_contents)
+    assert tokenizer.encode_file(corpus_path, num_workers=2) == ids
+    assert tokenizer.encode_file(corpus_path, num_workers=1) == ids
+
+    # Windows line endings are translated as when the file is read in text mode
+    crlf_path = tmp_path / "corpus_crlf.txt"
+    crlf_path.write_bytes(corpus_contents.replace("\n", "\r\n").encode("utf-8") + b"\r")
+    with open(crlf_path) as f:
+        ids = tokenizer.encode(f.read())
+    assert tokenizer.encode_file(crlf_path, num_workers=2) == ids
+    assert tokenizer.encode_file(crlf_path, num_workers=1) == ids
+
+
+def test_encode_to_file_matches_encode_iterable(tmp_path):
+    tokenizer = get_tokenizer_from_vocab_merges_path(
+        vocab_path=VOCAB_PATH, merges_path=MERGES_PATH, special_tokens=["<|endoftext|>"]
+    )
+    with open(FIXTURES_PATH / "tinystories_sample.txt") as f:
+        all_ids = list(tokenizer.encode_iterable(f))
+    output_path = tmp_path / "tinystories_sample.bin"
+    with open(FIXTURES_PATH / "tinystories_sample.txt") as f:
+        num_tokens = tokenizer.encode_to_file(f, output_path, buffer_size=100)
+    assert num_tokens == len(all_ids)
+
+    token_ids = load_token_ids(output_path)
+    assert token_ids.dtype == np.uint16
+    assert token_ids.tolist() == all_ids
+
+
+def test_encode_iterable_chunks_matches_encode():
+    tokenizer = get_tokenizer_from_vocab_merges_path(
+        vocab_path=VOCAB_PATH, merges_path=MERGES_PATH, special_tokens=["<|endoftext|>", "the end"]
+    )
+    with open(FIXTURES_PATH / "tinystories_sample.txt") as f:
+        lines = f.readlines()
+    # whitespace at line starts only pre-tokenizes like the whole text if lines are not encoded one by one
+    lines += ["  indented\n", "\n", "   \n", "the", " end<|endoftext|>", "", "Héllò hôw 🙃 "]
+    expected_ids = tokenizer.encode("".join(lines))
+    for chunk_size in [1, 50, 2**14]:
+        chunks = list(tokenizer.encode_iterable_chunks(lines, chunk_size=chunk_size))
+        assert all(chunk.dtype == np.uint16 for chunk in chunks)
+        assert np.concatenate(chunks).tolist() == expected_ids
+    assert list(tokenizer.encode_iterable(lines)) == expected_ids
+
+
+def test_encode_iterable_chunks_without_spaces():
+    tokenizer = get_tokenizer_from_vocab_merges_path(
+        vocab_path=VOCAB_PATH, merges_path=MERGES_PATH, special_tokens=["<|endoftext|>"]
+    )
+    # no space anywhere: the chunks are cut at punctuation and lone newlines
+    lines = ["这是一个中文句子，没有空格。\n", "1,2,3,4,5\n", "\t\t\n"] * 300
+    chunk_texts = list(tokenizer._iter_chunks(lines, 100))
+    assert len(chunk_texts) > 10 and max(map(len, chunk_texts)) < 200
+    chunks = list(tokenizer.encode_iterable_chunks(lines, chunk_size=100))
+    assert np.concatenate(chunks).tolist() == tokenizer.encode("".join(lines))
+
+    # a single pre-token longer than the hard cap is split rather than buffered whole
+    lines = ["a" * 50] * 1000
+    chunk_texts = list(tokenizer._iter_chunks(lines, 100))
+    assert "".join(chunk_texts) == "".join(lines)
+    assert max(map(len, chunk_texts)) <= MAX_CHUNK_FACTOR * 100 + 50
+
+    # but a special token is not, even while it is still incomplete at the end of the buffer
+    for lines in [["a" * 200 + "<|endo", "ftext|>b"], ["<|endoftext|>" * 20 + "<|endo", "ftext|>" + "a" * 200]]:
+        ids = np.concatenate(list(tokenizer.encode_iterable_chunks(lines, chunk_size=2))).tolist()
+        assert ids.count(50256) == "".join(lines).count("<|endoftext|>")
+        assert tokenizer.decode(ids) == "".join(lines)
+
+
+def test_count_tokens_and_truncate():
+    tokenizer = get_tokenizer_from_vocab_merges_path(
+        vocab_path=VOCAB_PATH, merges_path=MERGES_PATH, special_tokens=["<|endoftext|>"]
+    )
+    with open(FIXTURES_PATH / "tinystories_sample.txt") as f:
+        corpus_contents = f.read()
+    texts = [
+        "",
+        "Héllò hôw <|endoftext|><|endoftext|> are ü? 🙃",
+        "  spaces   and\n\n newlines \u3000\n\xa0x ",
+        corpus_contents,
+    ]
+    for text in texts:
+        ids = tokenizer.encode(text)
+        assert tokenizer.count_tokens(text) == len(ids)
+        assert tokenizer.truncate(text, len(ids)) == text
+        for max_tokens in range(0, min(len(ids), 60)):
+            truncated = tokenizer.truncate(text, max_tokens)
+            assert text.startswith(truncated)
+            truncated_ids = tokenizer.encode(truncated)
+            assert len(truncated_ids) <= max_tokens
+            assert truncated_ids == ids[: len(truncated_ids)]
+
+
+def test_count_tokens_memory_usage():
+    tokenizer = get_tokenizer_from_vocab_merges_path(
+        vocab_path=VOCAB_PATH, merges_path=MERGES_PATH, special_tokens=["<|endoftext|>"]
+    )
+    with open(FIXTURES_PATH / "tinystories_sample.txt") as f:
+        text = f.read().replace("<|endoftext|>", "") * 200  # ~750K characters without special tokens
+    num_tokens = tokenizer.count_tokens(text)  # warm the merge cache
+    tracemalloc.start()
+    try:
+        assert tokenizer.count_tokens(text) == num_tokens
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert num_tokens == len(tokenizer.encode(text))
+    # the pre-tokens (or token IDs) of the whole text alone would take several MB
+    assert peak < 2 * 2**20
+
+
+def test_encode_with_offsets():
+    tokenizer = get_tokenizer_from_vocab_merges_path(
+        vocab_path=VOCAB_PATH, merges_path=MERGES_PATH, special_tokens=["<|endoftext|>"]
+    )
+    with open(FIXTURES_PATH / "tinystories_sample.txt") as f:
+        lines = f.readlines()
+    lines += ["Héllò hôw <|endoftext|><|endoftext|> are ü? 🙃\n", "  straße 🙃🙃 "]
+    text = "".join(lines)
+    ids, starts, ends = tokenizer.encode_with_offsets(text)
+    assert ids.tolist() == tokenizer.encode(text)
+    assert starts.dtype == ends.dtype == np.int64
+    assert ends[-1] == len(text) and (starts <= ends).all() and (starts[1:] >= starts[:-1]).all()
+    for token_id, start, end in zip(ids.tolist(), starts.tolist(), ends.tolist()):
+        if text[start:end].isascii():
+            assert tokenizer.vocab[token_id] == text[start:end].encode("utf-8")
+        else:
+            assert tokenizer.vocab[token_id] in text[start:end].encode("utf-8")
+
+    # "🙃" is split across tokens that all cover it
+    emoji_ids, emoji_starts, emoji_ends = tokenizer.encode_with_offsets("a🙃")
+    assert len(emoji_ids) > 2
+    assert emoji_starts.tolist() == [0] + [1] * (len(emoji_ids) - 1)
+    assert emoji_ends.tolist() == [1] + [2] * (len(emoji_ids) - 1)
+
+    text_bytes = text.encode("utf-8")
+    ids, byte_starts, byte_ends = tokenizer.encode_with_offsets(text, byte_offsets=True)
+    assert [text_bytes[start:end] for start, end in zip(byte_starts, byte_ends)] == [
+        tokenizer.vocab[token_id] for token_id in ids.tolist()
+    ]
+
+    for byte_offsets, expected in [(False, (starts, ends)), (True, (byte_starts, byte_ends))]:
+        chunks = list(tokenizer.encode_iterable_with_offsets(lines, chunk_size=100, byte_offsets=byte_offsets))
+        assert len(chunks) > 1
+        assert np.concatenate([chunk_ids for chunk_ids, _, _ in chunks]).tolist() == ids.tolist()
+        assert np.concatenate([chunk_starts for _, chunk_starts, _ in chunks]).tolist() == expected[0].tolist()
+        assert np.concatenate([chunk_ends for _, _, chunk_ends in chunks]).tolist() == expected[1].tolist()
+
+
+def test_encode_batch_matches_encode():
+    tokenizer = get_tokenizer_from_vocab_merges_path(
+        vocab_path=VOCAB_PATH, merges_path=MERGES_PATH, special_tokens=["<|endoftext|>"]
+    )
+    with open(FIXTURES_PATH / "tinystories_sample.txt") as f:
+        texts = f.read().split("\n") + ["", "Héllò hôw <|endoftext|><|endoftext|> are ü? 🙃"]
+    expected_ids = [tokenizer.encode(text) for text in texts]
+
+    for num_workers, use_processes in [(1, False), (3, False), (2, True)]:
+        ids, offsets = tokenizer.encode_batch(texts, num_workers=num_workers, use_processes=use_processes)
+        assert len(offsets) == len(texts) + 1
+        assert [ids[offsets[i] : offsets[i + 1]].tolist() for i in range(len(texts))] == expected_ids
+
+
+def test_decode_array_and_batch():
+    tokenizer = get_tokenizer_from_vocab_merges_path(
+        vocab_path=VOCAB_PATH, merges_path=MERGES_PATH, special_tokens=["<|endoftext|>"]
+    )
+    texts = ["Héllò hôw <|endoftext|> are ü? 🙃", "the quick brown fox jumps over"]
+    rows = [tokenizer.encode(text) for text in texts]
+    assert tokenizer.decode(np.array(rows[0])) == texts[0]
+    assert tokenizer.decode_array(torch.tensor(rows[1])) == texts[1]
+    assert tokenizer.decode_array(np.array([], dtype=np.int64)) == ""
+
+    width = min(len(row) for row in rows)
+    batch = np.array([row[:width] for row in rows])
+    assert tokenizer.decode_batch(batch) == [tokenizer.decode(row[:width]) for row in rows]
+    assert tokenizer.decode_batch(torch.from_numpy(batch)) == tokenizer.decode_batch(batch)
+
+    for bad_ids in [[0, len(tokenizer.vocab)], [-1, 0]]:
+        with pytest.raises(ValueError):
+            tokenizer.decode_array(np.array(bad_ids))
+
+
+def test_incremental_decoder_streams_complete_characters():
+    tokenizer = get_tokenizer_from_vocab_merges_path(
+        vocab_path=VOCAB_PATH, merges_path=MERGES_PATH, special_tokens=["<|endoftext|>"]
+    )
+    test_string = "Héllò hôw <|endoftext|> are ü? 🙃"
+    decoder = tokenizer.incremental_decoder()
+    pieces = [decoder.decode(_id) for _id in tokenizer.encode(test_string)]
+    assert "".join(pieces) + decoder.flush() == test_string
+    assert all("�" not in piece for piece in pieces)
+
+    # "🙃" is split across tokens: nothing is emitted until its last byte arrives
+    ids = tokenizer.encode("🙃")
+    assert len(ids) > 1
+    assert [decoder.decode(_id) for _id in ids] == [""] * (len(ids) - 1) + ["🙃"]
+    decoder.decode(ids[0])
+    assert decoder.flush() == "�"
+
+
+def test_save_load_binary_tokenizer(tmp_path):
+    tokenizer = get_tokenizer_from_vocab_merges_path(
+        vocab_path=VOCAB_PATH, merges_path=MERGES_PATH, special_tokens=["<|endoftext|>", "<|endoftext|><|endoftext|>"]
+    )
+    tokenizer_path = tmp_path / "gpt2.bpe"
+    tokenizer.save(tokenizer_path)
+    loaded_tokenizer = Tokenizer.load(tokenizer_path)
+    test_string = "Héllò hôw <|endoftext|><|endoftext|> are ü? 🙃<|endoftext|>"
+    ids = loaded_tokenizer.encode(test_string)
+    assert ids == tokenizer.encode(test_string)
+    assert loaded_tokenizer.decode(np.array(ids)) == test_string
+    # encoding and decoding arrays work off the mapped arrays, without the Python vocab and merges
+    assert loaded_tokenizer._vocab is None and loaded_tokenizer._merges is None
+
+    assert loaded_tokenizer.vocab == tokenizer.vocab
+    assert loaded_tokenizer.merges == tokenizer.merges
+    assert sorted(loaded_tokenizer.special_tokens) == sorted(tokenizer.special_tokens)
+    assert loaded_tokenizer.decode(ids) == test_string
+
+    # a special token missing from the file is added to the vocabulary, as in the constructor
+    extended_tokenizer = Tokenizer.load(tokenizer_path, special_tokens=["<|endoftext|>", "<|pad|>"])
+    pad_id = len(tokenizer.vocab)
+    assert extended_tokenizer.vocab[pad_id] == b"<|pad|>"
+    endoftext_id = tokenizer.reverse_vocab[b"<|endoftext|>"]
+    assert extended_tokenizer.encode("a<|pad|>b<|endoftext|>") == [64, pad_id, 65, endoftext_id]
+    assert extended_tokenizer.decode(np.array([pad_id, 64])) == "<|pad|>a"
+
+    with open(tokenizer_path, "r+b") as f:
+        f.write(b"NOTBPE!!")
+    with pytest.raises(ValueError):
+        Tokenizer.load(tokenizer_path)
+
+
 @pytest.mark.skipif(
     not sys.platform.startswith("linux"),
     reason="rlimit support for non-linux systems is spotty.",
@@ -1,8 +1,16 @@
 import json
+import os
 import time
+from collections import Counter
 
+import pytest
+import regex as re
+
+from . import adapters, train_bpe
 from .adapters import run_train_bpe
+from .train_bpe import BPETrainer, TrainStats, _iter_text_blocks, count_pre_tokens
 from .common import FIXTURES_PATH, gpt2_bytes_to_unicode
+from .constants import PAT
 
 
 def test_train_bpe_speed():
@@ -62,6 +70,181 @@ def test_train_bpe():
     assert set(vocab.values()) == set(reference_vocab.values())
 
 
+def test_count_pre_tokens_streaming_blocks(tmp_path):
+    """
+    Counting the pre-tokens block by block must give the same counts as counting the whole file at once,
+    whatever the block size.
+    """
+    text = (FIXTURES_PATH / "tinystories_sample.txt").read_text(encoding="utf-8")
+    input_path = tmp_path / "corpus.txt"
+    input_path.write_bytes(text.replace("\n", "\r\n", 50).encode("utf-8") + "héllo wörld\n\n 42".encode("utf-8"))
+    for special_tokens in (["<|endoftext|>"], []):
+        expected = count_pre_tokens(input_path, special_tokens, num_workers=1, block_size=1 << 30)
+        for block_size in (1, 7, 64, 4096):
+            assert count_pre_tokens(input_path, special_tokens, num_workers=1, block_size=block_size) == expected
+
+
+def test_count_pre_tokens_streaming_non_ascii(tmp_path):
+    """
+    Text without special tokens, spaces or ASCII is still cut into blocks, at the pre-token boundaries of
+    its punctuation and lone newlines (with CRLF line endings split across reads).
+    """
+    line = "这是一个中文句子，没有空格。第二句话在这里！\r\n" + "Ünïcödé\u3000テキスト123\n"
+    input_path = tmp_path / "corpus.txt"
+    input_path.write_bytes((line * 2000).encode("utf-8"))
+    text = input_path.read_text(encoding="utf-8")
+    expected = Counter(pre_token.encode("utf-8") for pre_token in re.findall(PAT, text))
+    for block_size in (5, 4096):
+        blocks = list(_iter_text_blocks(input_path, 0, os.path.getsize(input_path), [], block_size=block_size))
+        assert len(blocks) > 1 and max(len(block.encode("utf-8")) for block in blocks) < block_size + 200
+        assert count_pre_tokens(input_path, [], num_workers=1, block_size=block_size) == expected
+
+
+def test_count_pre_tokens_parallel_shards(tmp_path):
+    """
+    Counting over several byte ranges in worker processes must give the same counts as a single process.
+    """
+    text = (FIXTURES_PATH / "tinystories_sample.txt").read_text(encoding="utf-8") * 20
+    input_path = tmp_path / "corpus.txt"
+    input_path.write_bytes(text.replace("\n", "\r\n", 300).encode("utf-8") + "héllo wörld\r\n 42".encode("utf-8"))
+    expected = count_pre_tokens(input_path, ["<|endoftext|>"], num_workers=1)
+    stats = TrainStats()
+    counts = count_pre_tokens(input_path, ["<|endoftext|>"], num_workers=4, stats=stats, min_shard_bytes=1 << 10)
+    assert counts == expected
+    assert stats.num_bytes == input_path.stat().st_size
+
+
+def test_count_pre_tokens_cache(tmp_path):
+    """
+    Pre-token counts are cached per file, PAT and special tokens, and a changed file is counted again.
+    """
+    input_path = tmp_path / "corpus.txt"
+    input_path.write_bytes((FIXTURES_PATH / "corpus.en").read_bytes())
+    cache_dir = tmp_path / "cache"
+
+    expected = count_pre_tokens(input_path, ["<|endoftext|>"])
+    assert count_pre_tokens(input_path, ["<|endoftext|>"], cache_dir=cache_dir) == expected
+    assert len(list(cache_dir.iterdir())) == 1
+    assert count_pre_tokens(input_path, ["<|endoftext|>"], cache_dir=cache_dir) == expected
+    assert len(list(cache_dir.iterdir())) == 1
+
+    count_pre_tokens(input_path, [], cache_dir=cache_dir)
+    assert len(list(cache_dir.iterdir())) == 2
+
+    input_path.write_bytes(b"hello world<|endoftext|>hello")
+    assert count_pre_tokens(input_path, ["<|endoftext|>"], cache_dir=cache_dir, hash_content=True) == {
+        b"hello": 2,
+        b" world": 1,
+    }
+
+
+def test_train_bpe_hashes_input_once(tmp_path, monkeypatch):
+    """
+    With a checkpoint and a pre-token cache, the content hash of the input is computed once for both.
+    """
+    calls = []
+    cache_key = train_bpe._pre_token_cache_key
+
+    def counted_cache_key(*args):
+        calls.append(args)
+        return cache_key(*args)
+
+    monkeypatch.setattr(adapters, "_pre_token_cache_key", counted_cache_key)
+    monkeypatch.setattr(train_bpe, "_pre_token_cache_key", counted_cache_key)
+    run_train_bpe(
+        FIXTURES_PATH / "corpus.en",
+        300,
+        ["<|endoftext|>"],
+        checkpoint_path=tmp_path / "bpe.ckpt",
+        pre_token_cache_dir=tmp_path / "cache",
+        hash_content=True,
+    )
+    assert len(calls) == 1
+    assert len(list((tmp_path / "cache").iterdir())) == 1
+
+
+def test_train_bpe_resume_from_checkpoint(tmp_path):
+    """
+    A run that is interrupted and resumed from its checkpoint must end with the same vocab and merges
+    as an uninterrupted run.
+    """
+    input_path = FIXTURES_PATH / "corpus.en"
+    checkpoint_path = tmp_path / "bpe.ckpt"
+    expected_vocab, expected_merges = run_train_bpe(input_path, 500, ["<|endoftext|>"])
+
+    # stop at a smaller vocab, then continue the finished run
+    run_train_bpe(input_path, 400, ["<|endoftext|>"], checkpoint_path=checkpoint_path, checkpoint_every=50)
+    assert checkpoint_path.exists()
+    vocab, merges = run_train_bpe(input_path, 500, ["<|endoftext|>"], checkpoint_path=checkpoint_path)
+    assert merges == expected_merges
+    assert vocab == expected_vocab
+
+    # the final checkpoint is kept and marked complete, but never resumed on a smaller vocab or another corpus
+    assert BPETrainer.from_checkpoint(checkpoint_path).complete
+    with pytest.raises(ValueError):
+        run_train_bpe(input_path, 300, ["<|endoftext|>"], checkpoint_path=checkpoint_path)
+    other_input_path = tmp_path / "corpus.txt"
+    other_input_path.write_bytes((FIXTURES_PATH / "tinystories_sample.txt").read_bytes())
+    with pytest.raises(ValueError):
+        run_train_bpe(other_input_path, 500, ["<|endoftext|>"], checkpoint_path=checkpoint_path)
+
+
+def test_train_bpe_resume_interrupted_run(tmp_path, monkeypatch):
+    """
+    A run that fails mid-way, as if the job had been preempted, resumes from its last periodic checkpoint.
+    """
+    input_path = FIXTURES_PATH / "corpus.en"
+    checkpoint_path = tmp_path / "bpe.ckpt"
+    expected_vocab, expected_merges = run_train_bpe(input_path, 500, ["<|endoftext|>"])
+
+    merge = BPETrainer.merge
+
+    def preempted_merge(self, pair):
+        if len(self.merges) == 123:
+            raise RuntimeError("preempted")
+        return merge(self, pair)
+
+    monkeypatch.setattr(BPETrainer, "merge", preempted_merge)
+    with pytest.raises(RuntimeError, match="preempted"):
+        run_train_bpe(input_path, 500, ["<|endoftext|>"], checkpoint_path=checkpoint_path, checkpoint_every=50)
+    monkeypatch.undo()
+
+    trainer = BPETrainer.from_checkpoint(checkpoint_path)
+    assert not trainer.complete
+    assert len(trainer.merges) == 100
+    vocab, merges = run_train_bpe(input_path, 500, ["<|endoftext|>"], checkpoint_path=checkpoint_path)
+    assert merges == expected_merges
+    assert vocab == expected_vocab
+    assert BPETrainer.from_checkpoint(checkpoint_path).complete
+
+
+def test_train_bpe_warm_start():
+    """
+    Extending the vocab and merges of a smaller run must give the same result as training from scratch.
+    """
+    input_path = FIXTURES_PATH / "corpus.en"
+    expected_vocab, expected_merges = run_train_bpe(input_path, 500, ["<|endoftext|>"])
+
+    small_vocab, small_merges = run_train_bpe(input_path, 350, ["<|endoftext|>"])
+    vocab, merges = run_train_bpe(input_path, 500, ["<|endoftext|>"], warm_start=(small_vocab, small_merges))
+    assert merges == expected_merges
+    assert vocab == expected_vocab
+
+
+def test_train_bpe_stats():
+    input_path = FIXTURES_PATH / "corpus.en"
+    stats = TrainStats()
+    _, merges = run_train_bpe(input_path, 500, ["<|endoftext|>"], stats=stats)
+
+    assert stats.num_bytes == input_path.stat().st_size
+    assert stats.num_distinct_pre_tokens > 0 and stats.num_pre_tokens >= stats.num_distinct_pre_tokens
+    assert stats.num_merges == len(merges)
+    assert min(stats.affected_words) >= 1
+    assert stats.merges_per_second > 0
+    assert stats.peak_rss_bytes > 0
+    assert json.loads(json.dumps(stats.as_dict()))["num_merges"] == len(merges)
+
+
 def test_train_bpe_special_tokens(snapshot):
     """
     Ensure that the special tokens are added to the vocabulary and not
@@ -1,35 +1,338 @@
-from .constants import PAT
-from typing import Iterable, Iterator
+from .pretokenizer import PreTokenizer, find_pre_tokens, is_shard_token, translate_newlines
+from cs336_basics.pretokenization_example import find_chunk_boundaries
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import codecs
+from typing import Iterable, Iterator, NamedTuple
+import heapq
+import itertools
+import json
+import mmap
+import os
 import pickle
-import regex as re
+import struct
+import numpy as np
+import threading
+
+
+# Binary tokenizer file (see `Tokenizer.save`): magic, format version, number of vocab slots
+# (max token ID + 1), number of merges and number of special tokens, followed by 8-byte aligned arrays.
+TOKENIZER_FILE_MAGIC = b"CS336BPE"
+TOKENIZER_FILE_VERSION = 1
+_TOKENIZER_FILE_HEADER = struct.Struct("<8sIQQQ")
+# chunks of `Tokenizer.encode_iterable_chunks` are cut anyway past this many times their size
+MAX_CHUNK_FACTOR = 64
+
+
+def _tokenizer_file_layout(num_ids: int, num_merges: int, num_special: int, vocab_bytes: int, special_bytes: int):
+    """
+    Byte offset of every array in a binary tokenizer file, shared by `Tokenizer.save` and `Tokenizer.load`.
+    """
+    sections = [
+        ("vocab_offsets", np.int64, num_ids + 1),
+        ("special_offsets", np.int64, num_special + 1),
+        ("merges", np.int32, 3 * num_merges),
+        ("vocab_valid", np.bool_, num_ids),
+        ("vocab_buffer", np.uint8, vocab_bytes),
+        ("special_buffer", np.uint8, special_bytes),
+    ]
+    layout = {}
+    position = _TOKENIZER_FILE_HEADER.size
+    for name, dtype, count in sections:
+        position = (position + 7) & ~7  # align every array to 8 bytes
+        layout[name] = (position, dtype, count)
+        position += np.dtype(dtype).itemsize * count
+    return layout
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    size_bytes: int
+
+
+class PreTokenCache(object):
+    """
+    A bounded LRU cache from pre-token bytes to their final (merged) token IDs.
+
+    Natural text is dominated by a few thousand pre-tokens (" the", " and", " was"), so caching
+    the merge result turns most of the encoding work into a dictionary lookup.
+    The cache is bounded by a maximum number of entries and/or an approximate byte budget;
+    the least recently used entries are evicted first once either bound is exceeded.
+    """
+
+    def __init__(self, max_entries: int | None = 2**14, max_bytes: int | None = None):
+        """
+        Args:
+            max_entries (int, optional): Maximum number of cached pre-tokens. None means no limit on the count.
+            max_bytes (int, optional): Budget for the cached payload, counted as the length of each pre-token
+                plus 8 bytes per token ID. None means no limit on the size.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # type: OrderedDict[bytes, tuple[int, ...]]
+        self._lock = threading.Lock()  # the cache is shared by the threads of `encode_batch`
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]  # locks cannot be pickled, e.g. when sending the tokenizer to worker processes
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _entry_size(pre_token: bytes, token_ids: tuple[int, ...]) -> int:
+        return len(pre_token) + 8 * len(token_ids)
+
+    def get(self, pre_token: bytes) -> tuple[int, ...] | None:
+        with self._lock:
+            token_ids = self._entries.get(pre_token)
+            if token_ids is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(pre_token)  # mark as most recently used
+            self.hits += 1
+            return token_ids
+
+    def put(self, pre_token: bytes, token_ids: tuple[int, ...]) -> None:
+        if self.max_entries == 0:
+            return
+        size = self._entry_size(pre_token, token_ids)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return  # would evict the whole cache for a single entry
+        with self._lock:
+            self._put(pre_token, token_ids, size)
+
+    def _put(self, pre_token: bytes, token_ids: tuple[int, ...], size: int) -> None:
+        old_token_ids = self._entries.pop(pre_token, None)
+        if old_token_ids is not None:
+            self.size_bytes -= self._entry_size(pre_token, old_token_ids)
+        self._entries[pre_token] = token_ids
+        self.size_bytes += size
+        while (self.max_entries is not None and len(self._entries) > self.max_entries) or (
+            self.max_bytes is not None and self.size_bytes > self.max_bytes
+        ):
+            evicted_pre_token, evicted_token_ids = self._entries.popitem(last=False)
+            self.size_bytes -= self._entry_size(evicted_pre_token, evicted_token_ids)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.evictions, len(self._entries), self.size_bytes)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, pre_token: bytes) -> bool:
+        return pre_token in self._entries
+
+
+class IncrementalDecoder(object):
+    """
+    A stateful decoder for streaming generation, fed one token ID at a time.
+
+    A multi-byte character can be split across tokens (e.g. the 4 bytes of "🙃"), so decoding each
+    token on its own yields U+FFFD replacement characters. This decoder buffers the trailing partial
+    UTF-8 sequence and only emits text once the character is complete, in O(1) amortized time per token.
+    """
+
+    def __init__(self, vocab: dict[int, bytes]):
+        self.vocab = vocab
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def decode(self, token_id: int) -> str:
+        """
+        Feed a token ID and return the text completed by it (possibly an empty string).
+        """
+        token_bytes = self.vocab.get(token_id)
+        if token_bytes is None:
+            raise ValueError(f"Token ID {token_id} not found in vocabulary.")
+        return self._decoder.decode(token_bytes)
+
+    def flush(self) -> str:
+        """
+        Return the remaining buffered bytes (as replacement characters if incomplete) and reset the state.
+        """
+        return self._decoder.decode(b"", final=True)
+
+    def reset(self) -> None:
+        self._decoder.reset()
+
 
 class Tokenizer(object):
     """
     A class to handle tokenization of text data.
     """
     
-    def __init__(self, vocab: dict[int, bytes], merges: list[tuple[bytes, bytes]], special_tokens: list[str] | None = None):
+    def __init__(
+        self,
+        vocab: dict[int, bytes] | None,
+        merges: list[tuple[bytes, bytes]] | None,
+        special_tokens: list[str] | None = None,
+        cache_size: int | None = 2**14,
+        cache_bytes: int | None = None,
+        decode_table: tuple[np.ndarray, np.ndarray, np.ndarray] | None = None,
+        merge_ids: np.ndarray | None = None,
+    ):
         """
         Initialize the Tokenizer with vocabulary and merges.
         Add special tokens to the vocabulary if provided and not present.
         
         Args:
-            vocab (dict[int, bytes]): A dictionary mapping token IDs to byte strings.
-            merges (list[tuple]): A list of tuples representing merges.
+            vocab (dict[int, bytes]): A dictionary mapping token IDs to byte strings,
+                or None to build it from `decode_table` on first use.
+            merges (list[tuple]): A list of tuples representing merges,
+                or None to build it from `merge_ids` on first use.
             special_tokens (list, optional): List of special tokens to include.
+            cache_size (int, optional): Maximum number of pre-tokens kept in the merge cache (0 disables caching).
+            cache_bytes (int, optional): Approximate byte budget of the merge cache.
+            decode_table (tuple, optional): The (buffer, offsets, valid) decode table of the vocabulary (see `load`).
+            merge_ids (np.ndarray, optional): (left_id, right_id, merged_id) rows of the merges, merged_id is -1
+                if the merged bytes are not in the vocabulary (see `save`).
         """
-        self.vocab = vocab
-        self.merges = merges
+        self._vocab = vocab
+        self._merges = merges
+        self._reverse_vocab = None  # built on first use by `reverse_vocab`
+        self._decode_table = decode_table  # built on first use by `_get_decode_table` if not given
+        self._merge_ids = merge_ids
+        self._pair_table = None  # built on first use by `_get_pair_table`
         self.special_tokens = list(set(special_tokens)) if special_tokens else []  # Ensure special tokens are unique
         
         # Add special tokens to the vocabulary if they are not already present
-        for special_token in self.special_tokens:
-            if special_token.encode('utf-8') not in self.vocab.values():
+        special_ids = self._token_ids([special_token.encode('utf-8') for special_token in self.special_tokens])
+        for special_token, special_id in zip(self.special_tokens, special_ids):
+            if special_id is None:
                 self.vocab[len(self.vocab)] = special_token.encode('utf-8')
+                self._reverse_vocab = None
+                self._decode_table = None
                 print(f"Added special token '{special_token}' to vocabulary with ID {len(self.vocab) - 1}.")
         
-        self.reverse_vocab = {v: k for k, v in vocab.items()}  # Reverse mapping for decoding
-    
+        # token ID of every single byte (None if the byte is not in the vocabulary)
+        self._byte_ids = self._token_ids([bytes([b]) for b in range(256)])
+
+        # Special tokens are resolved through a dict and split out by the pre-tokenizer.
+        # A text that contains none of their first characters cannot contain a special token,
+        # which lets `encode` skip the special-token scan entirely for most short texts.
+        special_bytes = [token.encode('utf-8') for token in self.special_tokens]
+        self._special_token_ids = {
+            token: token_id for token, token_id in zip(self.special_tokens, self._token_ids(special_bytes))
+            if token_id is not None  # all of them, the missing ones were added above
+        }
+        self._special_token_initials = {token[0] for token in self.special_tokens if token}
+        self.pre_tokenizer = PreTokenizer(self.special_tokens)  # special tokens and pre-tokens in one pass
+
+        self.cache = PreTokenCache(max_entries=cache_size, max_bytes=cache_bytes)  # pre-token bytes -> token IDs
+
+    @property
+    def vocab(self) -> dict[int, bytes]:
+        if self._vocab is None:
+            assert self._decode_table is not None  # a tokenizer is made from a vocab or a decode table
+            buffer, offsets, valid = self._decode_table
+            vocab_bytes = buffer.tobytes()
+            offsets = offsets.tolist()
+            valid_ids = np.flatnonzero(valid).tolist()
+            self._vocab = dict(zip(valid_ids, (vocab_bytes[offsets[i]:offsets[i + 1]] for i in valid_ids)))
+        return self._vocab
+
+    @property
+    def merges(self) -> list[tuple[bytes, bytes]]:
+        if self._merges is None:
+            assert self._merge_ids is not None  # a tokenizer is made from merges or merge IDs
+            vocab = self.vocab
+            self._merges = list(zip(
+                map(vocab.__getitem__, self._merge_ids[:, 0].tolist()),
+                map(vocab.__getitem__, self._merge_ids[:, 1].tolist()),
+            ))
+        return self._merges
+
+    @property
+    def reverse_vocab(self) -> dict[bytes, int]:
+        if self._reverse_vocab is None:
+            self._reverse_vocab = {v: k for k, v in self.vocab.items()}  # Reverse mapping for decoding
+        return self._reverse_vocab
+
+    def _token_ids(self, tokens: list[bytes]) -> list[int | None]:
+        """
+        Token ID of each byte string (None if it is not in the vocabulary).
+
+        Before `reverse_vocab` is built, e.g. right after `load`, only the decode table entries
+        with the lengths of `tokens` are read, instead of building the reverse mapping of the whole vocabulary.
+        """
+        if self._reverse_vocab is not None or self._decode_table is None:
+            return [self.reverse_vocab.get(token) for token in tokens]
+        buffer, offsets, valid = self._decode_table
+        lengths = np.diff(offsets)
+        token_ids = {}
+        for length in {len(token) for token in tokens}:
+            candidates = np.flatnonzero(valid & (lengths == length))
+            data = buffer[offsets[candidates, None] + np.arange(length)].tobytes()
+            # later IDs win on duplicate bytes, as in `reverse_vocab`
+            token_ids.update(zip(
+                (data[i * length:(i + 1) * length] for i in range(len(candidates))), candidates.tolist()
+            ))
+        return [token_ids.get(token) for token in tokens]
+
+    def _get_pair_table(self) -> dict[tuple[int, int], tuple[int, int]]:
+        """
+        Precomputed (left_id, right_id) -> (rank, merged_id), so the merge loop works purely on ints.
+        Merges whose parts or result are not in the vocabulary can never be applied and are left out.
+        Built on first use, so loading a tokenizer that is only used for decoding stays cheap.
+        """
+        if self._pair_table is None:
+            if self._merge_ids is not None:
+                merge_ids = self._merge_ids
+                mergeable = merge_ids[:, 2] >= 0
+                self._pair_table = dict(zip(
+                    zip(merge_ids[mergeable, 0].tolist(), merge_ids[mergeable, 1].tolist()),
+                    zip(np.flatnonzero(mergeable).tolist(), merge_ids[mergeable, 2].tolist()),
+                ))
+            else:
+                self._pair_table = self._build_pair_table()
+        return self._pair_table
+
+    def _build_pair_table(self) -> dict[tuple[int, int], tuple[int, int]]:
+        pair_table = {}
+        for rank, (left, right) in enumerate(self.merges):
+            left_id = self.reverse_vocab.get(left)
+            right_id = self.reverse_vocab.get(right)
+            merged_id = self.reverse_vocab.get(left + right)
+            if left_id is not None and right_id is not None and merged_id is not None:
+                pair_table[(left_id, right_id)] = (rank, merged_id)
+        return pair_table
+
+    def _get_decode_table(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Flat decode table: the bytes of token i are buffer[offsets[i]:offsets[i + 1]], so whole
+        arrays of IDs can be decoded with one fancy-indexing gather.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray]: The byte buffer, the offsets and a mask of
+                the valid token IDs (IDs can have gaps).
+        """
+        if self._decode_table is None:
+            num_ids = max(self.vocab) + 1 if self.vocab else 0
+            token_bytes = [self.vocab.get(i, b"") for i in range(num_ids)]
+            buffer = np.frombuffer(b"".join(token_bytes), dtype=np.uint8)
+            offsets = np.zeros(num_ids + 1, dtype=np.int64)
+            np.cumsum([len(b) for b in token_bytes], out=offsets[1:])
+            valid = np.zeros(num_ids, dtype=bool)
+            valid[list(self.vocab)] = True
+            self._decode_table = (buffer, offsets, valid)
+        return self._decode_table
+
     @classmethod
     def from_files(cls, vocab_filepath: str, merges_filepath: str, special_tokens: list[str] | None = None):
         """
@@ -53,79 +356,202 @@ class Tokenizer(object):
         
         return cls(vocab=vocab, merges=merges, special_tokens=special_tokens)
     
-    def _split_and_preserve_special_tokens(self, text, special_tokens):
-            """
-            LEARNING:
-            1. With (), the regex patter is constructed to capture the special tokens after the split. 
-            2. For example, if special_tokens = ["<|endoftext|>", "<|startoftext|>"], the pattern becomes 
-                "(<\|endoftext\|>|<\|startoftext\|>)". This means that when we split the text, 
-                the special tokens themselves will be included in the resulting list of parts, as a separate item in the list.
-            """
-            # Sort special tokens by length in descending order to match longer tokens first
-            sorted_special_tokens = sorted(special_tokens, key=len, reverse=True)
-            # Create a regex pattern that captures the special tokens
-            pattern = f"({'|'.join(map(re.escape, sorted_special_tokens))})"
-            # Split while preserving the tokens as separate elements
-            parts = re.split(pattern, text)
-            return [part for part in parts if part]  # Remove empty strings    
-    
-    
+    def save(self, path: str | os.PathLike) -> None:
+        """
+        Save the tokenizer to a single versioned binary file that `load` can memory-map.
+
+        The vocabulary is stored as the flat decode table (one byte buffer plus an offsets array),
+        the merges as (left, right, merged) token ID triples and the special tokens as a UTF-8
+        buffer plus offsets.
+
+        Args:
+            path (str | os.PathLike): Path of the file to write.
+        """
+        # (left_id, right_id, merged_id) per merge, merged_id is -1 if the merged bytes are not in the vocabulary
+        merges = self._merge_ids
+        if merges is None:
+            merges = np.empty((len(self.merges), 3), dtype=np.int32)
+            for i, (left, right) in enumerate(self.merges):
+                if left not in self.reverse_vocab or right not in self.reverse_vocab:
+                    raise ValueError(f"Merge {(left, right)} is not made of vocabulary tokens.")
+                merges[i] = (
+                    self.reverse_vocab[left], self.reverse_vocab[right], self.reverse_vocab.get(left + right, -1)
+                )
+        vocab_buffer, vocab_offsets, vocab_valid = self._get_decode_table()
+        special_bytes = [token.encode('utf-8') for token in self.special_tokens]
+        special_offsets = np.zeros(len(special_bytes) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in special_bytes], out=special_offsets[1:])
+        arrays = {
+            "vocab_offsets": vocab_offsets,
+            "special_offsets": special_offsets,
+            "merges": merges.ravel(),
+            "vocab_valid": vocab_valid,
+            "vocab_buffer": vocab_buffer,
+            "special_buffer": np.frombuffer(b"".join(special_bytes), dtype=np.uint8),
+        }
+        num_ids = len(vocab_valid)
+        layout = _tokenizer_file_layout(
+            num_ids, len(merges), len(special_bytes), len(vocab_buffer), int(special_offsets[-1])
+        )
+        with open(path, "wb") as f:
+            f.write(_TOKENIZER_FILE_HEADER.pack(
+                TOKENIZER_FILE_MAGIC, TOKENIZER_FILE_VERSION, num_ids, len(merges), len(special_bytes)
+            ))
+            for name, (position, dtype, _) in layout.items():
+                f.write(b"\0" * (position - f.tell()))
+                f.write(np.ascontiguousarray(arrays[name], dtype=dtype).tobytes())
+
+    @classmethod
+    def load(cls, path: str | os.PathLike, special_tokens: list[str] | None = None, **kwargs) -> "Tokenizer":
+        """
+        Load a tokenizer saved with `save`.
+
+        The file is memory-mapped read-only and the decode table and merges are used in place, so processes
+        loading the same file share its pages instead of each holding a copy. The `vocab` and `merges`
+        Python objects and the pair table of the merge loop are only built on first use.
+
+        Args:
+            path (str | os.PathLike): Path of the binary tokenizer file.
+            special_tokens (list, optional): Special tokens to use instead of the ones stored in the file.
+            **kwargs: Extra keyword arguments for the Tokenizer constructor (e.g. `cache_size`).
+
+        Returns:
+            Tokenizer: An instance of the Tokenizer class.
+        """
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, num_ids, num_merges, num_special = _TOKENIZER_FILE_HEADER.unpack_from(buffer)
+        if magic != TOKENIZER_FILE_MAGIC:
+            raise ValueError(f"{path} is not a tokenizer file.")
+        if version != TOKENIZER_FILE_VERSION:
+            raise ValueError(f"Unsupported tokenizer file version {version} (expected {TOKENIZER_FILE_VERSION}).")
+
+        def read_array(name):
+            position, dtype, count = layout[name]
+            return np.frombuffer(buffer, dtype=dtype, count=count, offset=position)
+
+        # the buffer sizes are only known once the offsets are read
+        layout = _tokenizer_file_layout(num_ids, num_merges, num_special, 0, 0)
+        vocab_offsets = read_array("vocab_offsets")
+        special_offsets = read_array("special_offsets")
+        layout = _tokenizer_file_layout(
+            num_ids, num_merges, num_special, int(vocab_offsets[-1]), int(special_offsets[-1])
+        )
+        vocab_buffer = read_array("vocab_buffer")
+        vocab_valid = read_array("vocab_valid")
+
+        merge_ids = read_array("merges").reshape(num_merges, 3)
+        if special_tokens is None:
+            special_bytes = read_array("special_buffer").tobytes()
+            special_offsets = special_offsets.tolist()
+            special_tokens = [
+                special_bytes[start:end].decode('utf-8')
+                for start, end in zip(special_offsets[:-1], special_offsets[1:])
+            ]
+
+        # `vocab`, `merges` and the pair table are built from the mapped arrays on first use
+        return cls(
+            vocab=None, merges=None, special_tokens=special_tokens,
+            decode_table=(vocab_buffer, vocab_offsets, vocab_valid), merge_ids=merge_ids, **kwargs
+        )
+
     def _merge_bpe(self, token_ids: list[int]) -> list[int]:
         """
         Merge BPE tokens to the smallest rank merges in the vocabulary (that generates the most common pairs)
+
+        The tokens are kept in a doubly linked list, and the candidate pairs in a min-heap keyed
+        on (rank, position). Each merge only pushes the two new pairs formed with the neighbors
+        of the merged token, so a pre-token of n bytes costs O(n log n) instead of O(n^2).
+        Heap entries whose left or right token has changed since they were pushed are stale
+        and skipped when popped. Pairs are resolved through the precomputed pair table,
+        so no bytes are concatenated or hashed while merging.
+
         Args:
             token_ids (list[int]): A list of token IDs to merge.
-        
+
         Returns:
             list[int]: A list of merged token IDs.
         """
-        # Pre-compute merge lookup table for O(1) access
-        if not hasattr(self, '_merge_ranks'):
-            self._merge_ranks = {merge: rank for rank, merge in enumerate(self.merges)}
-        
-        # Pre-compute byte sequences to avoid repeated lookups
-        byte_sequences = [self.vocab[tid] for tid in token_ids]
-        
-        while True:
-            best_rank = float('inf')
-            best_pos = -1
-            
-            # Find the pair with lowest rank (highest priority) in the merges
-            for i in range(len(byte_sequences) - 1):
-                pair = (byte_sequences[i], byte_sequences[i + 1])
-                
-                # O(1) lookup instead of O(n) search
-                rank = self._merge_ranks.get(pair, -1)
-                
-                if rank != -1 and rank < best_rank:
-                    best_rank = rank
-                    best_pos = i
-            
-            if best_pos == -1:
-                break  # No more merges possible
-            
-            # Merge the best pair
-            merged_bytes = byte_sequences[best_pos] + byte_sequences[best_pos + 1]
-            
-            # Find the token ID for the merged bytes
-            if merged_bytes in self.reverse_vocab:
-                new_id = self.reverse_vocab[merged_bytes]
-                new_byte_sequence = self.vocab[new_id]
-                
-                # Update byte sequences efficiently
-                byte_sequences[best_pos] = new_byte_sequence
-                byte_sequences.pop(best_pos + 1)
-                
-                # Update token IDs efficiently
-                token_ids[best_pos] = new_id
-                token_ids.pop(best_pos + 1)
-            else:
-                # If merged token not in vocab, mark this pair as unmergeable
-                # by setting a very high rank to avoid checking it again
-                self._merge_ranks[(byte_sequences[best_pos], byte_sequences[best_pos + 1])] = float('inf')
-        
+        n = len(token_ids)
+        if n < 2:
+            return token_ids
+
+        pair_table = self._get_pair_table()
+        ids = token_ids
+        prev_pos = list(range(-1, n - 1))
+        next_pos = list(range(1, n + 1))
+        next_pos[-1] = -1
+
+        heap = []
+        for i in range(n - 1):
+            left, right = ids[i], ids[i + 1]
+            merge = pair_table.get((left, right))
+            if merge is not None:
+                heap.append((merge[0], i, left, right, merge[1]))
+        heapq.heapify(heap)
+
+        while heap:
+            # ties on rank are broken by position, so the leftmost occurrence merges first
+            _, i, left, right, merged_id = heapq.heappop(heap)
+            j = next_pos[i]
+            if ids[i] != left or j == -1 or ids[j] != right:
+                continue  # stale entry
+
+            ids[i] = merged_id
+            ids[j] = -1  # mark the right token as removed
+            k = next_pos[j]
+            next_pos[i] = k
+            if k != -1:
+                prev_pos[k] = i
+                merge = pair_table.get((merged_id, ids[k]))
+                if merge is not None:
+                    heapq.heappush(heap, (merge[0], i, merged_id, ids[k], merge[1]))
+            h = prev_pos[i]
+            if h != -1:
+                merge = pair_table.get((ids[h], merged_id))
+                if merge is not None:
+                    heapq.heappush(heap, (merge[0], h, ids[h], merged_id, merge[1]))
+
+        # position 0 is never removed, since a merge always keeps its left position
+        merged_ids = []
+        i = 0
+        while i != -1:
+            merged_ids.append(ids[i])
+            i = next_pos[i]
+        return merged_ids
+
+    def _encode_pre_token(self, pre_token: bytes) -> tuple[int, ...]:
+        """
+        Encode a single pre-token to its token IDs, going through the merge cache.
+
+        Args:
+            pre_token (bytes): The UTF-8 bytes of the pre-token.
+
+        Returns:
+            tuple[int, ...]: The merged token IDs of the pre-token.
+        """
+        token_ids = self.cache.get(pre_token)
+        if token_ids is not None:
+            return token_ids
+        # Convert pre-token to individual byte token IDs first
+        byte_ids = self._byte_ids
+        token_ids = [token_id for token_id in map(byte_ids.__getitem__, pre_token) if token_id is not None]
+        """
+        LEARNING:
+        The encoding process is done in three steps:
+        1. First, the text is split into chunks, and each chunk is pre-tokenized.
+        2. Then, convert the pre-token to list of individual tokens
+        3. Apply BPE merging to the list of individual tokens, prioritize the smallest rank merges in the vocabulary (that generates the most common pairs)
+        """
+        token_ids = tuple(self._merge_bpe(token_ids))
+        self.cache.put(pre_token, token_ids)
         return token_ids
 
+    def cache_info(self) -> CacheInfo:
+        """
+        Report the hit/miss/eviction counters and the current size of the merge cache.
+        """
+        return self.cache.info()
 
     def encode(self, text: str) -> list[int]:
         """
@@ -138,33 +564,213 @@ class Tokenizer(object):
             list: A list of token IDs.        
         """    
 
-        chunks = self._split_and_preserve_special_tokens(text, self.special_tokens) if self.special_tokens else [text]
-        # pre-tokenize each chunk
         full_text_after_encoding = []
-        for chunk in chunks:
-            if chunk in self.special_tokens: # the entire chunk is a special token
-                full_text_after_encoding.append(self.reverse_vocab[chunk.encode('utf-8')])
-            else:
-                # pre-tokenize the chunk
-                pre_tokens_strs = re.findall(PAT, chunk)
-                pre_tokens_bytes = [pre_token.encode('utf-8') for pre_token in pre_tokens_strs]
-                # Encode each pre-token to token IDs
-                for pre_token in pre_tokens_bytes:
-                    # Convert pre-token to individual byte tokens first
-                    byte_tokens = [bytes([b]) for b in pre_token]
-                    # Encode bytes to token IDs
-                    token_ids = [self.reverse_vocab[bt] for bt in byte_tokens if bt in self.reverse_vocab]                    
-                    """
-                    LEARNING:
-                    The encoding process is done in three steps:
-                    1. First, the text is split into chunks, and each chunk is pre-tokenized.
-                    2. Then, convert the pre-token to list of individual tokens
-                    3. Apply BPE merging to the list of individual tokens, prioritize the smallest rank merges in the vocabulary (that generates the most common pairs)
-                    """
-                    token_ids = self._merge_bpe(token_ids)
-                    full_text_after_encoding.extend(token_ids)
+        self._encode_into(text, full_text_after_encoding)
         return full_text_after_encoding
-                
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Count the tokens of a text, i.e. `len(encode(text))`, without building the list of token IDs.
+        The pre-tokens are counted one bounded stretch at a time, and each distinct one is merged once per stretch.
+
+        Args:
+            text (str): The input text to tokenize.
+
+        Returns:
+            int: The number of token IDs of the text.
+        """
+        num_tokens = 0
+        encode_pre_token = self._encode_pre_token
+        for pieces in self.pre_tokenizer.stretches(text):
+            if isinstance(pieces, str):  # a special token
+                num_tokens += 1
+            else:
+                for pre_token, count in Counter(pieces).items():
+                    num_tokens += count * len(encode_pre_token(pre_token.encode('utf-8')))
+        return num_tokens
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Cut a text to fit a budget of tokens.
+
+        The text is walked lazily one pre-token (or special token) at a time, and the walk stops at the first
+        one that does not fit, so the cost depends on `max_tokens` rather than on the length of the text.
+        Pre-tokens are never split, so the result encodes to the first token IDs of `encode(text)`.
+
+        Args:
+            text (str): The input text to tokenize.
+            max_tokens (int): Maximum number of tokens of the result.
+
+        Returns:
+            str: The longest prefix of the text, cut between two pre-tokens, that has at most `max_tokens` tokens
+                (`len(result.encode('utf-8'))` is the byte offset of the cut). The cut is never made after a
+                whitespace pre-token that follows another one, since the prefix would pre-tokenize differently.
+        """
+        num_tokens = 0
+        end = 0
+        after_whitespace = False
+        special_token_ids = self._special_token_ids
+        encode_pre_token = self._encode_pre_token
+        for start, piece_end in self.pre_tokenizer.spans(text):
+            piece = text[start:piece_end]
+            if piece in special_token_ids:
+                num_tokens += 1
+                whitespace = False
+            else:
+                num_tokens += len(encode_pre_token(piece.encode('utf-8')))
+                whitespace = piece.isspace()
+            if num_tokens > max_tokens:
+                break
+            # a run of whitespace split into two pre-tokens would be a single one at the end of the prefix
+            if not (whitespace and after_whitespace):
+                end = piece_end
+            after_whitespace = whitespace
+        return text[:end]
+
+    def encode_with_offsets(self, text: str, byte_offsets: bool = False) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Encode a text and locate every token in it.
+
+        The offsets come from the lengths of the pre-tokens and the byte lengths of the merged tokens, so no
+        token is decoded back. A token that starts or ends inside a multi-byte character (e.g. part of an emoji)
+        covers the whole character in character offsets.
+
+        Args:
+            text (str): The input text to tokenize.
+            byte_offsets (bool): Offsets into the UTF-8 bytes rather than the characters of the text.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray]: The token IDs (same as `encode`) and the int64 start and
+                end offsets of every token: token `i` comes from `text[starts[i]:ends[i]]`.
+        """
+        token_ids, starts, ends = [], [], []
+        self._encode_with_offsets_into(text, 0, byte_offsets, token_ids, starts, ends)
+        return (
+            np.array(token_ids, dtype=self.token_dtype()),
+            np.array(starts, dtype=np.int64),
+            np.array(ends, dtype=np.int64),
+        )
+
+    def _encode_with_offsets_into(
+        self, text: str, offset: int, byte_offsets: bool, token_ids: list[int], starts: list[int], ends: list[int]
+    ) -> int:
+        """
+        Encode a text that starts at `offset`, append its token IDs and their offsets, and return the offset of
+        the end of the text.
+        """
+        vocab = self.vocab
+        special_token_ids = self._special_token_ids
+        encode_pre_token = self._encode_pre_token
+        # the special tokens and pre-tokens cover the text back to back, so their lengths give their offsets
+        for pieces in self.pre_tokenizer.stretches(text):
+            if isinstance(pieces, str):  # a special token
+                token_ids.append(special_token_ids[pieces])
+                starts.append(offset)
+                offset += len(pieces.encode('utf-8')) if byte_offsets else len(pieces)
+                ends.append(offset)
+                continue
+            for piece in pieces:
+                piece_bytes = piece.encode('utf-8')
+                piece_ids = encode_pre_token(piece_bytes)
+                piece_length = len(piece_bytes) if byte_offsets else len(piece)
+                token_ids.extend(piece_ids)
+                if len(piece_ids) == 1:
+                    starts.append(offset)
+                    offset += piece_length
+                    ends.append(offset)
+                    continue
+                # byte offsets of the tokens within the pre-token
+                token_ends = list(itertools.accumulate(len(vocab[token_id]) for token_id in piece_ids))
+                token_starts = [0] + token_ends[:-1]
+                if not byte_offsets and len(piece_bytes) != len(piece):
+                    char_of_byte = [i for i, char in enumerate(piece) for _ in range(len(char.encode('utf-8')))]
+                    token_starts = [char_of_byte[b] for b in token_starts]
+                    token_ends = [char_of_byte[b - 1] + 1 for b in token_ends]
+                starts.extend(offset + b for b in token_starts)
+                ends.extend(offset + b for b in token_ends)
+                offset += piece_length
+        return offset
+
+    def _may_contain_special_token(self, text: str) -> bool:
+        return any(initial in text for initial in self._special_token_initials)
+
+    def _encode_into(self, text: str, out: list[int]) -> None:
+        """
+        Encode a text and append its token IDs to `out`.
+
+        Args:
+            text (str): The input text to tokenize.
+            out (list[int]): The list the token IDs are appended to.
+        """
+        if not self.special_tokens or not self._may_contain_special_token(text):
+            self._encode_chunk(text, out)
+            return
+        special_token_ids = self._special_token_ids
+        encode_pre_token = self._encode_pre_token
+        for pieces in self.pre_tokenizer.stretches(text):
+            if isinstance(pieces, str):  # a special token
+                out.append(special_token_ids[pieces])
+            else:
+                for pre_token in pieces:
+                    out.extend(encode_pre_token(pre_token.encode('utf-8')))
+
+    def _encode_chunk(self, chunk: str, out: list[int]) -> None:
+        # pre-tokenize the chunk (which holds no special tokens) and encode each pre-token to token IDs
+        encode_pre_token = self._encode_pre_token
+        for pre_token in find_pre_tokens(chunk):
+            out.extend(encode_pre_token(pre_token.encode('utf-8')))
+
+    def encode_batch(
+        self, texts: list[str], num_workers: int = 1, use_processes: bool = False
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Encode many (short) texts at once.
+
+        The merge cache is shared by all texts. The token IDs of all texts are returned as one flat array plus
+        an offsets array, so no Python list is built per text: the IDs of `texts[i]` are
+        `ids[offsets[i]:offsets[i + 1]]`.
+
+        Args:
+            texts (list[str]): The input texts to tokenize.
+            num_workers (int): Number of threads (or processes) the batch is split across.
+            use_processes (bool): Fan out over a process pool instead of a thread pool.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The flat token IDs and the `len(texts) + 1` offsets into them.
+        """
+        num_workers = max(1, min(num_workers, len(texts)))
+        if num_workers == 1:
+            ids, lengths = self._encode_batch_flat(texts)
+        else:
+            # contiguous slices, so the results only need to be concatenated
+            bounds = [len(texts) * i // num_workers for i in range(num_workers + 1)]
+            slices = [texts[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+            if use_processes:
+                executor = ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker, initargs=(self,))
+                encode_slice = _encode_batch_slice
+            else:
+                executor = ThreadPoolExecutor(max_workers=num_workers)
+                encode_slice = self._encode_batch_flat
+            with executor:
+                results = list(executor.map(encode_slice, slices))
+            ids = np.concatenate([slice_ids for slice_ids, _ in results])
+            lengths = np.concatenate([slice_lengths for _, slice_lengths in results])
+
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return ids, offsets
+
+    def _encode_batch_flat(self, texts: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Encode texts into one flat array of token IDs and the number of token IDs of each text.
+        """
+        flat_ids = []
+        lengths = np.empty(len(texts), dtype=np.int64)
+        for i, text in enumerate(texts):
+            start = len(flat_ids)
+            self._encode_into(text, flat_ids)
+            lengths[i] = len(flat_ids) - start
+        return np.array(flat_ids, dtype=self.token_dtype()), lengths
 
     def encode_iterable(self, iterable: Iterable[str]) -> Iterator[int]:
         """
@@ -176,28 +782,293 @@ class Tokenizer(object):
         Returns:
             list: A list of token IDs for each text in the iterable.
         """
-        for text in iterable:
-            # Get the token IDs for this text
-            token_ids = self.encode(text)
+        for chunk_ids in self.encode_iterable_chunks(iterable):
             # Yield each individual token ID
             """
             LEARNING:
             1. the generator approach returns a generator object, which is an iterator being able to yield values one at a time when called
             2. when it is called, it yield the next value in the sequence, and pause the execution until the next call
             """
-            for token_id in token_ids:
-                yield token_id
+            yield from chunk_ids.tolist()
+
+    def encode_iterable_chunks(self, iterable: Iterable[str], chunk_size: int = 2**14) -> Iterator[np.ndarray]:
+        """
+        Encode an iterable of text (e.g. the lines of an open file) into arrays of token IDs.
+
+        Short texts are batched: they are accumulated until about `chunk_size` characters are buffered,
+        and the buffer is encoded up to its last safe cut (see `PreTokenizer.last_safe_cut`), the rest
+        being carried over to the next chunk. So the token IDs are exactly those of `encode` on the
+        concatenated texts, while `encode` is called once per chunk rather than once per line, and
+        peak memory stays bounded by the chunk size (up to `MAX_CHUNK_FACTOR` times, see `_iter_chunks`).
+
+        Args:
+            iterable (iterable): An iterable containing text strings.
+            chunk_size (int): Approximate number of characters encoded per chunk.
+
+        Returns:
+            Iterator[np.ndarray]: Arrays of token IDs (of dtype `token_dtype()`), in order.
+        """
+        dtype = self.token_dtype()
+        for chunk in self._iter_chunks(iterable, chunk_size):
+            yield self._encode_chunk_array(chunk, dtype)
+
+    def encode_iterable_with_offsets(
+        self, iterable: Iterable[str], chunk_size: int = 2**14, byte_offsets: bool = False
+    ) -> Iterator[tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Chunked `encode_with_offsets` of an iterable of text, batched like `encode_iterable_chunks`.
+
+        Args:
+            iterable (iterable): An iterable containing text strings.
+            chunk_size (int): Approximate number of characters encoded per chunk.
+            byte_offsets (bool): Offsets into the UTF-8 bytes rather than the characters of the text.
+
+        Returns:
+            Iterator[tuple[np.ndarray, np.ndarray, np.ndarray]]: The token IDs and start and end offsets of
+                every chunk, in order. Offsets are relative to the concatenated texts.
+        """
+        dtype = self.token_dtype()
+        offset = 0
+        for chunk in self._iter_chunks(iterable, chunk_size):
+            token_ids, starts, ends = [], [], []
+            offset = self._encode_with_offsets_into(chunk, offset, byte_offsets, token_ids, starts, ends)
+            yield np.array(token_ids, dtype=dtype), np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64)
+
+    def _iter_chunks(self, iterable: Iterable[str], chunk_size: int) -> Iterator[str]:
+        """
+        Concatenate an iterable of text and cut it at safe cuts into chunks of about `chunk_size` characters.
+
+        Only the newly added text is searched for a cut. Text without any safe cut in `MAX_CHUNK_FACTOR`
+        times `chunk_size` characters (i.e. a single pre-token that long) is cut anyway, which bounds
+        memory at the cost of splitting that pre-token, but never a special token (see `last_forced_cut`).
+        """
+        max_chunk_size = MAX_CHUNK_FACTOR * chunk_size
+        buffer = ""
+        pending = []
+        pending_size = 0
+        for text in iterable:
+            pending.append(text)
+            pending_size += len(text)
+            if pending_size < chunk_size:
+                continue
+            searched = len(buffer)
+            buffer += "".join(pending)
+            pending = []
+            pending_size = 0
+            cut = self.pre_tokenizer.last_safe_cut(buffer, searched - 2)  # the last cuts may have needed more text
+            if cut == -1 and len(buffer) >= max_chunk_size:
+                cut = self.pre_tokenizer.last_forced_cut(buffer)
+            if cut == -1:
+                continue
+            yield buffer[:cut]
+            buffer = buffer[cut:]
+        buffer += "".join(pending)
+        if buffer:
+            yield buffer
+
+    def _encode_chunk_array(self, text: str, dtype: np.dtype) -> np.ndarray:
+        """
+        Encode a chunk of `encode_iterable_chunks` into an array of token IDs. A chunk repeats most of its
+        pre-tokens, so each distinct one goes through the (locked) merge cache only once per chunk.
+        """
+        token_ids = []
+        chunk_cache = {}
+        special_token_ids = self._special_token_ids
+        encode_pre_token = self._encode_pre_token
+        for pieces in self.pre_tokenizer.stretches(text):
+            if isinstance(pieces, str):  # a special token
+                token_ids.append(special_token_ids[pieces])
+                continue
+            for pre_token in pieces:
+                pre_token_ids = chunk_cache.get(pre_token)
+                if pre_token_ids is None:
+                    pre_token_ids = chunk_cache[pre_token] = encode_pre_token(pre_token.encode('utf-8'))
+                token_ids.extend(pre_token_ids)
+        return np.array(token_ids, dtype=dtype)
     
-    def decode(self, ids: list[int]) -> str:
+    def token_dtype(self) -> np.dtype:
+        """
+        Smallest unsigned integer dtype that can hold every token ID of the vocabulary.
+        """
+        num_ids = len(self._get_decode_table()[2])  # max token ID + 1
+        return np.dtype(np.uint16) if num_ids <= 2**16 else np.dtype(np.uint32)
+
+    def encode_to_file(
+        self, iterable: Iterable[str], output_path: str | os.PathLike, buffer_size: int = 2**20
+    ) -> int:
+        """
+        Stream the token IDs of an iterable of text (e.g. an open file) to a raw binary file on disk.
+
+        Arrays of IDs from `encode_iterable_chunks` are gathered into blocks of at least `buffer_size` IDs
+        and appended to the file, so peak memory does not depend on the size of the corpus. The dtype
+        (uint16 or uint32) is chosen from the vocabulary size, and a JSON sidecar `<output_path>.json`
+        records the dtype and the token count. Use `load_token_ids` to memory-map the result.
+
+        Args:
+            iterable (iterable): An iterable containing text strings.
+            output_path (str | os.PathLike): Path of the binary file to write.
+            buffer_size (int): Minimum number of token IDs written per block (but the last).
+
+        Returns:
+            int: The number of tokens written.
+        """
+        dtype = self.token_dtype()
+        num_tokens = 0
+        with open(output_path, "wb") as f:
+            block = []
+            block_size = 0
+            for chunk_ids in self.encode_iterable_chunks(iterable):
+                block.append(chunk_ids)
+                block_size += chunk_ids.size
+                if block_size >= buffer_size:
+                    np.concatenate(block).tofile(f)
+                    num_tokens += block_size
+                    block = []
+                    block_size = 0
+            if block:
+                np.concatenate(block).tofile(f)
+                num_tokens += block_size
+
+        with open(f"{os.fspath(output_path)}.json", "w") as f:
+            vocab_size = int(self._get_decode_table()[2].sum())
+            json.dump({"dtype": dtype.name, "num_tokens": num_tokens, "vocab_size": vocab_size}, f)
+        return num_tokens
+
+    def _file_shards(self, path: str | os.PathLike, num_shards: int, split_special_token: str) -> list[tuple[int, int]]:
+        """
+        Split a file into byte ranges that can be encoded independently.
+
+        Every range after the first starts at an occurrence of `split_special_token`. This is only
+        safe when `is_shard_token` holds for it, since then the text on either side of a boundary is
+        encoded separately by `encode` anyway. Otherwise the whole file is returned as a single range.
+        """
+        file_size = os.path.getsize(path)
+        if not is_shard_token(split_special_token, self.special_tokens) or num_shards <= 1:
+            return [(0, file_size)] if file_size else []
+        with open(path, "rb") as f:
+            boundaries = find_chunk_boundaries(f, num_shards, split_special_token.encode("utf-8"))
+        return list(zip(boundaries[:-1], boundaries[1:]))
+
+    def encode_file(
+        self,
+        path: str | os.PathLike,
+        num_workers: int | None = None,
+        split_special_token: str = "<|endoftext|>",
+    ) -> list[int]:
+        """
+        Encode a (large) UTF-8 text file using a pool of worker processes.
+
+        The file is sharded on `split_special_token` with `find_chunk_boundaries`, each shard is
+        read and encoded by a worker, and the token IDs are concatenated in file order.
+        Newlines are translated as in training, so the result is identical to `encode(open(path).read())`
+        (a shard starts at a special token, so a "\\r\\n" is never split across two shards).
+
+        Args:
+            path (str | os.PathLike): Path to the text file.
+            num_workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+            split_special_token (str): Special token the shards are aligned to.
+
+        Returns:
+            list: A list of token IDs.
+        """
+        num_workers = num_workers or os.cpu_count() or 1
+        # a few shards per worker keep the pool busy when documents have uneven lengths
+        shards = self._file_shards(path, num_workers * 4, split_special_token)
+        token_ids = []
+        if num_workers == 1 or len(shards) <= 1:
+            for start, end in shards:
+                token_ids.extend(self.encode(_read_file_range(path, start, end)))
+            return token_ids
+
+        with ProcessPoolExecutor(
+            max_workers=min(num_workers, len(shards)), initializer=_init_worker, initargs=(self,)
+        ) as executor:
+            for shard_ids in executor.map(_encode_file_range, [path] * len(shards), *zip(*shards)):
+                token_ids.extend(shard_ids)
+        return token_ids
+
+    def _check_token_ids(self, ids: np.ndarray) -> None:
+        """
+        Raise a ValueError if any of the token IDs is not in the vocabulary.
+        """
+        vocab_valid = self._get_decode_table()[2]
+        in_range = (ids >= 0) & (ids < len(vocab_valid))
+        valid = in_range.copy()
+        valid[in_range] = vocab_valid[ids[in_range]]
+        if not valid.all():
+            raise ValueError(f"Token ID {ids[~valid][0]} not found in vocabulary.")
+
+    def _gather_bytes(self, ids: np.ndarray) -> tuple[bytes, np.ndarray]:
+        """
+        Concatenate the bytes of a 1D array of token IDs with a single gather from the flat decode table.
+
+        Returns:
+            tuple[bytes, np.ndarray]: The concatenated bytes and the byte length of each token.
+        """
+        self._check_token_ids(ids)
+        vocab_buffer, vocab_offsets, _ = self._get_decode_table()
+        starts = vocab_offsets[ids]
+        lengths = vocab_offsets[ids + 1] - starts
+        # index of every output byte = start of its token in the buffer + its position within the token
+        output_starts = np.cumsum(lengths) - lengths
+        byte_index = np.repeat(starts - output_starts, lengths) + np.arange(lengths.sum())
+        return vocab_buffer[byte_index].tobytes(), lengths
+
+    def decode_array(self, ids) -> str:
+        """
+        Decode a NumPy array or torch tensor of token IDs in bulk, without a Python loop per token.
+
+        Args:
+            ids (np.ndarray | torch.Tensor): Token IDs (flattened if multi-dimensional).
+
+        Returns:
+            str: The decoded text.
+        """
+        ids = _as_id_array(ids).ravel()
+        data, _ = self._gather_bytes(ids)
+        return data.decode('utf-8', errors='replace')
+
+    def decode_batch(self, ids) -> list[str]:
+        """
+        Decode a 2D batch of token IDs (e.g. sampled model outputs) into one string per row.
+
+        Args:
+            ids (np.ndarray | torch.Tensor): Token IDs of shape (batch_size, sequence_length).
+
+        Returns:
+            list[str]: The decoded text of each row.
+        """
+        ids = _as_id_array(ids)
+        if ids.ndim != 2:
+            raise ValueError(f"Expected a 2D batch of token IDs, got shape {ids.shape}.")
+        data, lengths = self._gather_bytes(ids.ravel())
+        row_offsets = np.zeros(ids.shape[0] + 1, dtype=np.int64)
+        np.cumsum(lengths.reshape(ids.shape).sum(axis=1), out=row_offsets[1:])
+        return [
+            data[start:end].decode('utf-8', errors='replace')
+            for start, end in zip(row_offsets[:-1].tolist(), row_offsets[1:].tolist())
+        ]
+
+    def incremental_decoder(self) -> IncrementalDecoder:
+        """
+        Create a stateful decoder that emits only complete characters, for streaming token-by-token output.
+        """
+        return IncrementalDecoder(self.vocab)
+
+    def decode(self, ids: list[int] | np.ndarray) -> str:
         """
         Decode a list of token IDs back into text.
         
         Args:
-            ids (list): A list of token IDs to decode.
+            ids (list | np.ndarray): A list of token IDs to decode, or a NumPy array or torch tensor of them
+                (see `decode_array`).
         
         Returns:
             str: The decoded text.
         """
+        # NumPy arrays and torch tensors take the vectorized path
+        if isinstance(ids, np.ndarray) or hasattr(ids, "detach"):
+            return self.decode_array(ids)
         byte_tokens = []
         for token_id in ids:
             if token_id in self.vocab:
@@ -206,3 +1077,59 @@ class Tokenizer(object):
                 raise ValueError(f"Token ID {token_id} not found in vocabulary.")
         decoded_text = b"".join(byte_tokens).decode('utf-8', errors='replace')
         return decoded_text
+
+
+def load_token_ids(path: str | os.PathLike) -> np.ndarray:
+    """
+    Memory-map a token ID file written by `Tokenizer.encode_to_file`.
+
+    Args:
+        path (str | os.PathLike): Path of the binary token ID file (its `.json` sidecar must exist).
+
+    Returns:
+        np.ndarray: A read-only, memory-mapped 1D array of token IDs.
+    """
+    with open(f"{os.fspath(path)}.json") as f:
+        header = json.load(f)
+    if header["num_tokens"] == 0:
+        return np.zeros(0, dtype=header["dtype"])  # mmap cannot map an empty file
+    return np.memmap(path, dtype=header["dtype"], mode="r", shape=(header["num_tokens"],))
+
+
+def _as_id_array(ids) -> np.ndarray:
+    if hasattr(ids, "detach"):  # torch.Tensor
+        ids = ids.detach().cpu().numpy()
+    ids = np.asarray(ids)
+    if ids.size and not np.issubdtype(ids.dtype, np.integer):
+        raise ValueError(f"Token IDs must be integers, got dtype {ids.dtype}.")
+    return ids.astype(np.int64, copy=False)
+
+
+# Tokenizer of the current pool worker process, set once by `_init_worker`
+# so that the (large) vocab and merges are not pickled with every task.
+_worker_tokenizer = None  # type: Tokenizer | None
+
+
+def _init_worker(tokenizer: Tokenizer) -> None:
+    global _worker_tokenizer
+    _worker_tokenizer = tokenizer
+
+
+def _read_file_range(path: str | os.PathLike, start: int, end: int) -> str:
+    with open(path, "rb") as f:
+        f.seek(start)
+        return translate_newlines(f.read(end - start).decode("utf-8"))
+
+
+def _get_worker_tokenizer() -> Tokenizer:
+    if _worker_tokenizer is None:
+        raise RuntimeError("The worker tokenizer is set by `_init_worker` when the pool starts.")
+    return _worker_tokenizer
+
+
+def _encode_file_range(path: str | os.PathLike, start: int, end: int) -> list[int]:
+    return _get_worker_tokenizer().encode(_read_file_range(path, start, end))
+
+
+def _encode_batch_slice(texts: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    return _get_worker_tokenizer()._encode_batch_flat(texts)
@@ -0,0 +1,715 @@
+from .constants import PAT
+from .pretokenizer import PreTokenizer, is_shard_token, translate_newlines
+from cs336_basics.pretokenization_example import find_chunk_boundaries
+from collections import Counter, defaultdict
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator
+import codecs
+import hashlib
+import heapq
+import json
+import os
+import pickle
+import time
+import psutil
+import threading
+
+_MIN_SHARD_BYTES = 1 << 20  # smaller files are not worth a process pool
+_BLOCK_SIZE = 1 << 22  # bytes read at a time when streaming a file range
+CHECKPOINT_VERSION = 2
+PRE_TOKEN_CACHE_VERSION = 1
+_RSS_SAMPLE_EVERY = 100  # merges between two samples of the resident set size
+
+
+def build_vocab(special_tokens: list[str], init_vocab_size: int = 256) -> dict[int, bytes]:
+    """
+    LEARNING:
+    1. Build the initial vocab with the first 256 bytes PULS the special tokens encoded in bytestring.
+    2. The special tokens are added first, and then the first 256 bytes are added.
+    """
+    vocab = {}  # type: dict[int, bytes]
+    idx = 0
+    # add special tokens to the vocab
+    for token in special_tokens:
+        vocab[idx] = token.encode("utf-8")  # encode the special token to bytes
+        idx += 1
+    # add the first 256 bytes to the vocab
+    for i in range(init_vocab_size):
+        vocab[idx] = bytes([i])
+        idx += 1
+    return vocab
+
+
+class TrainStats(object):
+    """
+    Timings and counters of a BPE training run, filled in by `count_pre_tokens` and `BPETrainer`.
+
+    The read and pre-tokenize times are summed over the worker processes, so with several workers
+    they add up to more than `pre_tokenization_seconds`, the wall time of that stage. Special tokens
+    are split off in the same scan as the pre-tokens, so their split is part of the pre-tokenize time.
+    """
+
+    def __init__(self):
+        self.read_seconds = 0.0  # reading, decoding and cutting the file into blocks
+        self.pre_tokenize_seconds = 0.0  # scanning the blocks for special tokens and pre-tokens, and counting them
+        self.pre_tokenization_seconds = 0.0  # wall time of the whole pre-tokenization stage
+        self.pre_token_cache_hit = False
+        self.num_bytes = 0
+        self.num_pre_tokens = 0
+        self.num_distinct_pre_tokens = 0
+        self.replay_seconds = 0.0  # applying the merges of a warm start
+        self.pair_count_seconds = 0.0  # counting the pairs, building the pair index and the heap
+        self.merge_seconds = 0.0
+        self.affected_words = array("I")  # number of words rewritten by each merge
+        self.peak_rss_bytes = 0  # highest resident set size sampled in any single process
+
+    def sample_rss(self) -> None:
+        self.peak_rss_bytes = max(self.peak_rss_bytes, psutil.Process().memory_info().rss)
+
+    def add_worker(self, worker_stats: "TrainStats") -> None:
+        """
+        Add the pre-tokenization counters of a worker process.
+        """
+        self.read_seconds += worker_stats.read_seconds
+        self.pre_tokenize_seconds += worker_stats.pre_tokenize_seconds
+        self.num_bytes += worker_stats.num_bytes
+        self.peak_rss_bytes = max(self.peak_rss_bytes, worker_stats.peak_rss_bytes)
+
+    @property
+    def num_merges(self) -> int:
+        return len(self.affected_words)
+
+    @property
+    def merges_per_second(self) -> float:
+        return self.num_merges / self.merge_seconds if self.merge_seconds else 0.0
+
+    @property
+    def mean_affected_words(self) -> float:
+        return sum(self.affected_words) / self.num_merges if self.num_merges else 0.0
+
+    @property
+    def max_affected_words(self) -> int:
+        return max(self.affected_words, default=0)
+
+    def as_dict(self) -> dict:
+        """
+        All the counters as a flat, JSON-serializable dict (without the per-merge affected words).
+        """
+        stats = {key: value for key, value in vars(self).items() if key != "affected_words"}
+        for key in ("num_merges", "merges_per_second", "mean_affected_words", "max_affected_words"):
+            stats[key] = getattr(self, key)
+        return stats
+
+    def __str__(self) -> str:
+        return "\n".join(
+            [
+                f"pre-tokenization: {self.pre_tokenization_seconds:.2f}s wall"
+                + (" (cached)" if self.pre_token_cache_hit else "")
+                + f", read {self.read_seconds:.2f}s, scan {self.pre_tokenize_seconds:.2f}s"
+                f" over {self.num_bytes / 2**20:.1f} MiB",
+                f"pre-tokens: {self.num_pre_tokens} ({self.num_distinct_pre_tokens} distinct)",
+                f"pair counting: {self.pair_count_seconds:.2f}s, warm start replay: {self.replay_seconds:.2f}s",
+                f"merges: {self.num_merges} in {self.merge_seconds:.2f}s ({self.merges_per_second:.0f}/s),"
+                f" affected words per merge: {self.mean_affected_words:.1f} mean, {self.max_affected_words} max",
+                f"peak RSS: {self.peak_rss_bytes / 2**20:.0f} MiB",
+            ]
+        )
+
+
+def _shard_token(special_tokens: list[str]) -> str | None:
+    """
+    A special token the file can be cut at: the text on either side of it is pre-tokenized separately
+    anyway, as long as no longer special token contains it.
+    """
+    for token in special_tokens:
+        if is_shard_token(token, special_tokens):
+            return token
+    return None
+
+
+def _iter_text_blocks(
+    path: str | os.PathLike,
+    start: int,
+    end: int,
+    special_tokens: list[str],
+    block_size: int = _BLOCK_SIZE,
+    stats: TrainStats | None = None,
+) -> Iterator[str]:
+    """
+    Stream the byte range [start, end) of a file as decoded text blocks of roughly `block_size` bytes.
+
+    Blocks are only cut where the pre-tokens do not depend on the cut (see `PreTokenizer.last_safe_cut`),
+    so a stretch of text without any such cut point is kept whole. Each search for a cut only covers the
+    newly read text.
+    """
+    stats = stats if stats is not None else TrainStats()
+    pre_tokenizer = PreTokenizer(special_tokens)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    carriage_return = ""  # a trailing "\r" waits for the next block, it may be the first half of a "\r\n"
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = f.read(min(block_size, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            stats.num_bytes += len(block)
+            text = carriage_return + decoder.decode(block)
+            carriage_return = "\r" if text.endswith("\r") else ""
+            searched = len(buffer)
+            # same universal newline translation as reading the file in text mode
+            buffer += translate_newlines(text[: len(text) - len(carriage_return)])
+            cut = pre_tokenizer.last_safe_cut(buffer, searched - 2)  # the last cuts may have needed more text
+            if cut != -1:
+                text = buffer[:cut]
+                buffer = buffer[cut:]
+                stats.read_seconds += time.perf_counter() - started
+                yield text
+                started = time.perf_counter()
+    buffer += translate_newlines(carriage_return + decoder.decode(b"", final=True))
+    if buffer:
+        stats.read_seconds += time.perf_counter() - started
+        yield buffer
+
+
+def _count_pre_tokens_in_range(
+    path: str | os.PathLike, start: int, end: int, special_tokens: list[str], block_size: int = _BLOCK_SIZE
+) -> tuple[Counter, TrainStats]:
+    """
+    Count the pre-tokens in the byte range [start, end) of a file, keyed by their UTF-8 bytes.
+
+    The range is streamed block by block, so memory is bounded by the block size and the number of
+    distinct pre-tokens rather than by the size of the range.
+
+    Returns:
+        tuple[Counter, TrainStats]: The counts, and the timings of this range.
+    """
+    stats = TrainStats()
+    pre_tokenizer = PreTokenizer(special_tokens)
+    counts = Counter()
+    for text in _iter_text_blocks(path, start, end, special_tokens, block_size, stats):
+        started = time.perf_counter()
+        counts.update(pre_tokenizer.pre_tokens(text))
+        stats.pre_tokenize_seconds += time.perf_counter() - started
+    started = time.perf_counter()
+    counts = Counter({pre_token.encode("utf-8"): count for pre_token, count in counts.items()})
+    stats.pre_tokenize_seconds += time.perf_counter() - started
+    stats.sample_rss()
+    return counts, stats
+
+
+def _write_atomic(path: str | os.PathLike, data: bytes) -> None:
+    """
+    Write `data` to a temporary file next to `path` and rename it over `path`, so that a crash while
+    writing never leaves a truncated file behind.
+    """
+    tmp_path = f"{os.fspath(path)}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _pre_token_cache_key(input_path: str | os.PathLike, special_tokens: list[str], hash_content: bool) -> str:
+    """
+    Fingerprint of a pre-token count: the input file, the pre-tokenization regex and the special tokens.
+
+    The file is identified by its size and mtime, or by its size and a SHA-256 of its content when
+    `hash_content` is set, which also survives copies and touches of an unchanged file.
+    """
+    stat = os.stat(input_path)
+    fingerprint = {
+        "version": PRE_TOKEN_CACHE_VERSION,
+        "size": stat.st_size,
+        "pat": PAT,
+        "special_tokens": sorted(set(special_tokens)),
+    }
+    if hash_content:
+        content_hash = hashlib.sha256()
+        with open(input_path, "rb") as f:
+            for block in iter(lambda: f.read(_BLOCK_SIZE), b""):
+                content_hash.update(block)
+        fingerprint["sha256"] = content_hash.hexdigest()
+    else:
+        fingerprint["mtime_ns"] = stat.st_mtime_ns
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def count_pre_tokens(
+    input_path: str | os.PathLike,
+    special_tokens: list[str],
+    num_workers: int | None = None,
+    block_size: int = _BLOCK_SIZE,
+    cache_dir: str | os.PathLike | None = None,
+    hash_content: bool = False,
+    stats: TrainStats | None = None,
+    min_shard_bytes: int = _MIN_SHARD_BYTES,
+    cache_key: str | None = None,
+) -> Counter:
+    """
+    Pre-tokenize a training file and count every pre-token, in parallel over byte ranges of the file.
+
+    The file is cut with `find_chunk_boundaries` at one of the special tokens, each worker streams and
+    counts its own range only, and the per-range Counters are summed. Memory per worker is bounded
+    by `block_size` and the number of distinct pre-tokens, not by the size of the file.
+
+    With a `cache_dir`, the counts are saved there under a fingerprint of the file, `PAT` and the
+    special tokens, and later calls with the same fingerprint load them instead of pre-tokenizing again.
+
+    Args:
+        input_path (str | os.PathLike): Path to the training data.
+        special_tokens (list[str]): Special tokens, removed from the text before pre-tokenization.
+        num_workers (int | None): Number of worker processes, defaults to the number of CPUs.
+        block_size (int): Number of bytes read at a time by each worker.
+        cache_dir (str | os.PathLike | None): Directory of the on-disk cache of pre-token counts.
+        hash_content (bool): Fingerprint the file by a hash of its content rather than by its mtime.
+        stats (TrainStats | None): Filled in with the timings and counters of the pre-tokenization.
+        min_shard_bytes (int): Smallest byte range worth a worker process, caps `num_workers` for small files.
+        cache_key (str | None): The `_pre_token_cache_key` of the file if the caller already has it, so that
+            a content hash is not computed twice.
+
+    Returns:
+        Counter: Frequency of every pre-token (as UTF-8 bytes).
+    """
+    stats = stats if stats is not None else TrainStats()
+    started = time.perf_counter()
+    pre_token_frequency = None
+    cache_path = None
+    if cache_dir is not None:
+        if cache_key is None:
+            cache_key = _pre_token_cache_key(input_path, special_tokens, hash_content)
+        cache_path = os.path.join(cache_dir, f"{cache_key}.pkl")
+        if os.path.exists(cache_path):
+            with open(cache_path, "rb") as f:
+                pre_token_frequency = Counter(pickle.load(f))
+            stats.pre_token_cache_hit = True
+    if pre_token_frequency is None:
+        pre_token_frequency = _count_pre_tokens(
+            input_path, special_tokens, num_workers, block_size, stats, min_shard_bytes
+        )
+        if cache_path is not None:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            _write_atomic(cache_path, pickle.dumps(dict(pre_token_frequency), protocol=pickle.HIGHEST_PROTOCOL))
+
+    stats.pre_tokenization_seconds += time.perf_counter() - started
+    stats.num_pre_tokens = sum(pre_token_frequency.values())
+    stats.num_distinct_pre_tokens = len(pre_token_frequency)
+    stats.sample_rss()
+    return pre_token_frequency
+
+
+def _count_pre_tokens(
+    input_path: str | os.PathLike,
+    special_tokens: list[str],
+    num_workers: int | None,
+    block_size: int,
+    stats: TrainStats,
+    min_shard_bytes: int = _MIN_SHARD_BYTES,
+) -> Counter:
+    """
+    Count the pre-tokens of a file over byte ranges, see `count_pre_tokens`.
+    """
+    file_size = os.path.getsize(input_path)
+    num_workers = num_workers or os.cpu_count() or 1
+    num_workers = max(1, min(num_workers, file_size // max(min_shard_bytes, 1)))
+
+    shard_token = _shard_token(special_tokens)
+    if num_workers > 1 and shard_token is not None:
+        with open(input_path, "rb") as f:
+            # a few ranges per worker so that uneven ranges still keep every worker busy
+            boundaries = find_chunk_boundaries(f, num_workers * 4, shard_token.encode("utf-8"))
+    else:
+        boundaries = [0, file_size]
+    shards = list(zip(boundaries[:-1], boundaries[1:]))
+
+    pre_token_frequency = Counter()
+    if num_workers == 1 or len(shards) == 1:
+        for start, end in shards:
+            counts, range_stats = _count_pre_tokens_in_range(input_path, start, end, special_tokens, block_size)
+            pre_token_frequency.update(counts)
+            stats.add_worker(range_stats)
+    else:
+        with ProcessPoolExecutor(max_workers=min(num_workers, len(shards))) as executor:
+            for counts, range_stats in executor.map(
+                _count_pre_tokens_in_range,
+                [input_path] * len(shards),
+                *zip(*shards),
+                [special_tokens] * len(shards),
+                [block_size] * len(shards),
+            ):
+                pre_token_frequency.update(counts)
+                stats.add_worker(range_stats)
+    return pre_token_frequency
+
+
+class _CheckpointWriter(object):
+    """
+    Write checkpoints to disk on a background thread, one at a time.
+    """
+
+    def __init__(self, path: str | os.PathLike):
+        self.path = path
+        self._thread = None
+        self._error = None
+
+    def _write(self, data: bytes) -> None:
+        try:
+            _write_atomic(self.path, data)
+        except BaseException as e:  # re-raised on the training thread by `wait`
+            self._error = e
+
+    def submit(self, data: bytes) -> None:
+        self.wait()
+        self._thread = threading.Thread(target=self._write, args=(data,), daemon=True)
+        self._thread.start()
+
+    def wait(self) -> None:
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+
+class _ReversedPair(object):
+    """
+    Heap key that orders pairs of token IDs by their bytes in reverse, so that the min-heap pops the
+    lexicographically greatest pair first among pairs with the same count.
+    """
+
+    __slots__ = ("pair", "key")
+
+    def __init__(self, pair: tuple[int, int], key: tuple[bytes, bytes]):
+        self.pair = pair
+        self.key = key
+
+    def __lt__(self, other: "_ReversedPair") -> bool:
+        return self.key > other.key
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _ReversedPair) and self.key == other.key
+
+
+class BPETrainer(object):
+    """
+    A BPE trainer that updates its pair statistics incrementally.
+
+    Instead of recounting every pair of every pre-token after each merge, the trainer keeps the
+    pair counts plus an inverted index from each pair to the pre-tokens ("words") containing it.
+    A merge then only re-counts the words that contain the merged pair.
+
+    The best pair is taken from a max-heap of (count, pair) entries. Entries are never updated in
+    place: a pair whose count changes is pushed again, and entries whose count no longer matches
+    `pair_counts` are discarded when they reach the top of the heap.
+
+    Words are compact arrays of token IDs and pairs are tuples of IDs, the bytes of the tokens
+    are only looked up to break ties and to return the merges at the end.
+    """
+
+    def __init__(
+        self,
+        pre_token_frequency: dict[bytes, int],
+        special_tokens: list[str],
+        stats: TrainStats | None = None,
+        input_fingerprint: str | None = None,
+    ):
+        """
+        Args:
+            pre_token_frequency (dict[bytes, int]): Frequency of every pre-token (as UTF-8 bytes) in the corpus.
+            special_tokens (list[str]): Special tokens to add to the vocabulary.
+            stats (TrainStats | None): Where to record the timings and counters of training.
+            input_fingerprint (str | None): Fingerprint of the corpus (see `_pre_token_cache_key`), saved with
+                the checkpoints so that they are not resumed on another corpus.
+        """
+        self.stats = stats if stats is not None else TrainStats()
+        self.special_tokens = list(special_tokens)
+        self.input_fingerprint = input_fingerprint
+        self.complete = False  # whether `train` has run to the end, recorded in the final checkpoint
+        self.vocab = build_vocab(special_tokens)
+        self.merges = []  # type: list[tuple[int, int]]
+
+        # token bytes -> ID used in the words, a merge that produces the bytes of an existing token
+        # reuses its ID so that equal bytes are always the same token
+        num_special = len(special_tokens)
+        self.token_ids = {bytes([i]): num_special + i for i in range(256)}  # type: dict[bytes, int]
+
+        # every pre-token as an array of token IDs, e.g. b' the' -> array('H', [ID(b' '), ID(b't'), ID(b'h'), ID(b'e')])
+        byte_ids = [num_special + i for i in range(256)]
+        self.typecode = "H" if len(self.vocab) <= 2**16 else "I"
+        self.words = [array(self.typecode, [byte_ids[b] for b in pre_token]) for pre_token in pre_token_frequency]
+        self.word_counts = list(pre_token_frequency.values())
+        self._build_index()
+
+    def _build_index(self) -> None:
+        """
+        Count every pair of the words, index the words containing each pair and build the heap.
+        """
+        started = time.perf_counter()
+        self.pair_counts = defaultdict(int)  # type: defaultdict[tuple[int, int], int]
+        self.pair_words = defaultdict(set)  # type: defaultdict[tuple[int, int], set[int]]
+        for idx, (word, count) in enumerate(zip(self.words, self.word_counts)):
+            for pair in zip(word, word[1:]):
+                self.pair_counts[pair] += count
+                self.pair_words[pair].add(idx)
+        self._build_heap()
+        self.stats.pair_count_seconds += time.perf_counter() - started
+        self.stats.sample_rss()
+
+    def _build_heap(self) -> None:
+        # heapq is a min-heap, so store the negated count and a reversed pair key
+        self._heap = [(-count, self._heap_key(pair)) for pair, count in self.pair_counts.items()]
+        heapq.heapify(self._heap)
+
+    def _dump_state(self) -> bytes:
+        """
+        Serialize everything needed to resume training. The heap is not saved, it is rebuilt from the pair counts.
+        """
+        state = {
+            "version": CHECKPOINT_VERSION,
+            "special_tokens": self.special_tokens,
+            "input_fingerprint": self.input_fingerprint,
+            "complete": self.complete,
+            "vocab": self.vocab,
+            "merges": self.merges,
+            "token_ids": self.token_ids,
+            "typecode": self.typecode,
+            "words": self.words,
+            "word_counts": self.word_counts,
+            "pair_counts": self.pair_counts,
+            "pair_words": self.pair_words,
+        }
+        return pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def save_checkpoint(self, path: str | os.PathLike) -> None:
+        """
+        Save the trainer state (pre-tokens and their counts, merges, vocab and pair index) to `path`.
+        """
+        _write_atomic(path, self._dump_state())
+
+    @classmethod
+    def from_checkpoint(
+        cls, path: str | os.PathLike, special_tokens: list[str] | None = None, input_fingerprint: str | None = None
+    ) -> "BPETrainer":
+        """
+        Resume a trainer from a checkpoint written by `save_checkpoint` or `train`.
+
+        Args:
+            path (str | os.PathLike): Path to the checkpoint.
+            special_tokens (list[str] | None): If given, must match the special tokens of the checkpoint.
+            input_fingerprint (str | None): If given, must match the fingerprint of the corpus of the checkpoint.
+        """
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        if state.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(f"{path} is not a BPE trainer checkpoint (version {CHECKPOINT_VERSION}).")
+        if special_tokens is not None and list(special_tokens) != state["special_tokens"]:
+            raise ValueError(
+                f"{path} was trained with special tokens {state['special_tokens']}, not {list(special_tokens)}."
+            )
+        if input_fingerprint is not None and input_fingerprint != state["input_fingerprint"]:
+            raise ValueError(f"{path} was trained on another corpus (or the corpus has changed since).")
+        del state["version"]
+        trainer = cls.__new__(cls)
+        trainer.__dict__.update(state)
+        trainer.stats = TrainStats()
+        trainer._build_heap()
+        return trainer
+
+    def _heap_key(self, pair: tuple[int, int]) -> _ReversedPair:
+        return _ReversedPair(pair, (self.vocab[pair[0]], self.vocab[pair[1]]))
+
+    def best_pair(self) -> tuple[int, int]:
+        """
+        LEARNING:
+        1. pop the heap until the top entry is still up to date, stale entries are simply dropped
+        2. ties on the count are broken by the greater lexicographic order of the bytes through _ReversedPair
+        """
+        heap, pair_counts = self._heap, self.pair_counts
+        while heap:
+            neg_count, key = heap[0]
+            if pair_counts.get(key.pair) == -neg_count:
+                return key.pair
+            heapq.heappop(heap)
+        raise ValueError("no pair left to merge")
+
+    def _widen_words(self) -> None:
+        """
+        Switch the words from 16-bit to 32-bit token IDs once the vocabulary outgrows 16 bits.
+        """
+        self.typecode = "I"
+        self.words = [array("I", word) for word in self.words]
+
+    def merge(self, pair: tuple[int, int]) -> int:
+        """
+        Merge every occurrence of `pair` and update the pair counts and index of the affected words only.
+
+        Returns:
+            int: The number of words that contained the pair.
+        """
+        left, right = pair
+        merged_token = self.vocab[left] + self.vocab[right]
+        merged_id = self.token_ids.setdefault(merged_token, len(self.vocab))
+        self.vocab[len(self.vocab)] = merged_token  # append new token in the vocab
+        if merged_id >= 2**16 and self.typecode == "H":
+            self._widen_words()
+
+        words, typecode = self.words, self.typecode
+        pair_counts, pair_words = self.pair_counts, self.pair_words
+        touched = set()  # pairs whose count changed and need a fresh heap entry
+        affected_words = 0
+        for idx in pair_words.pop(pair, ()):
+            word, count = words[idx], self.word_counts[idx]
+            new_word = array(typecode)
+            i, n = 0, len(word)
+            while i < n:
+                if word[i] == left and i < n - 1 and word[i + 1] == right:
+                    new_word.append(merged_id)
+                    i += 2
+                else:
+                    new_word.append(word[i])
+                    i += 1
+            # the index is not pruned when a word loses a pair, so the word may not contain it anymore
+            if len(new_word) == n:
+                continue
+            affected_words += 1
+
+            for old_pair in zip(word, word[1:]):
+                pair_counts[old_pair] -= count
+                touched.add(old_pair)
+                if pair_counts[old_pair] == 0:
+                    del pair_counts[old_pair]
+            for new_pair in zip(new_word, new_word[1:]):
+                pair_counts[new_pair] += count
+                pair_words[new_pair].add(idx)
+                touched.add(new_pair)
+            words[idx] = new_word
+        pair_counts.pop(pair, None)
+        for touched_pair in touched:
+            touched_count = pair_counts.get(touched_pair)
+            if touched_count:
+                heapq.heappush(self._heap, (-touched_count, self._heap_key(touched_pair)))
+
+        self.merges.append(pair)
+        return affected_words
+
+    def replay(self, merges: list[tuple[bytes, bytes]]) -> None:
+        """
+        Warm start: apply the merges of an earlier run on the same pre-tokens without searching for them.
+
+        Replaying is much cheaper than training: the merges are applied word by word and the pair index
+        is built once at the end, instead of updating the counts and the heap after every merge. Each
+        word still goes through the merges in order, as `merge` would, so training on afterwards gives
+        the same merges as a run from scratch.
+
+        Args:
+            merges (list[tuple[bytes, bytes]]): Merges returned by an earlier `train` with the same special tokens.
+        """
+        if self.merges:
+            raise ValueError("Merges can only be replayed on a trainer that has not merged anything yet.")
+        started = time.perf_counter()
+        # pair of IDs -> ranks at which it is merged, with the ID of the merged token
+        merge_ranks = defaultdict(list)  # type: defaultdict[tuple[int, int], list[tuple[int, int]]]
+        for rank, (left_token, right_token) in enumerate(merges):
+            left, right = self.token_ids.get(left_token), self.token_ids.get(right_token)
+            if left is None or right is None:
+                raise ValueError(f"Merge {rank} {(left_token, right_token)} uses a token that was never created.")
+            merged_token = left_token + right_token
+            merge_ranks[(left, right)].append((rank, self.token_ids.setdefault(merged_token, len(self.vocab))))
+            self.vocab[len(self.vocab)] = merged_token
+            self.merges.append((left, right))
+        if len(self.vocab) > 2**16 and self.typecode == "H":
+            self._widen_words()
+
+        typecode = self.typecode
+        for idx, word in enumerate(self.words):
+            word = list(word)
+            last_rank = -1
+            while len(word) > 1:
+                # the next merge that applies to this word, i.e. the lowest rank after the last one applied
+                best = None
+                for pair in zip(word, word[1:]):
+                    for rank, merged_id in merge_ranks.get(pair, ()):
+                        if rank > last_rank:
+                            if best is None or rank < best[0]:
+                                best = (rank, merged_id, pair)
+                            break
+                if best is None:
+                    break
+                last_rank, merged_id, (left, right) = best
+                new_word = []
+                i, n = 0, len(word)
+                while i < n:
+                    if word[i] == left and i < n - 1 and word[i + 1] == right:
+                        new_word.append(merged_id)
+                        i += 2
+                    else:
+                        new_word.append(word[i])
+                        i += 1
+                word = new_word
+            self.words[idx] = array(typecode, word)
+        self.stats.replay_seconds += time.perf_counter() - started
+        self._build_index()
+
+    def train(
+        self,
+        vocab_size: int,
+        checkpoint_path: str | os.PathLike | None = None,
+        checkpoint_every: int = 1000,
+        progress: bool = False,
+    ) -> tuple[dict[int, bytes], list[tuple[bytes, bytes]]]:
+        """
+        Merge the best pair until the vocabulary reaches `vocab_size` (or no pair is left).
+
+        Args:
+            vocab_size (int): Size of the final vocabulary, including the special tokens. Raises a ValueError
+                if the trainer (e.g. resumed from a checkpoint) already has more tokens than that.
+            checkpoint_path (str | os.PathLike | None): If given, the trainer state is saved there every
+                `checkpoint_every` merges and at the end, where it is marked complete: resuming it again
+                continues the run to a larger `vocab_size`. Only the serialization happens on the training
+                thread, the file is written in the background.
+            checkpoint_every (int): Number of merges between two checkpoints.
+            progress (bool): Show a tqdm progress bar of the merges.
+
+        Returns:
+            tuple[dict[int, bytes], list[tuple[bytes, bytes]]]: The vocabulary and the merges.
+        """
+        if len(self.vocab) > vocab_size:
+            raise ValueError(f"The trainer already has {len(self.vocab)} tokens, more than vocab_size={vocab_size}.")
+        stats = self.stats
+        self.complete = False
+        writer = _CheckpointWriter(checkpoint_path) if checkpoint_path is not None else None
+        progress_bar = None
+        if progress:
+            from tqdm import tqdm
+
+            progress_bar = tqdm(total=max(vocab_size - len(self.vocab), 0), unit="merge", desc="BPE merges")
+
+        started = time.perf_counter()
+        try:
+            while len(self.vocab) < vocab_size and self.pair_counts:
+                stats.affected_words.append(self.merge(self.best_pair()))
+                if progress_bar is not None:
+                    progress_bar.update()
+                if len(self.merges) % _RSS_SAMPLE_EVERY == 0:
+                    stats.sample_rss()
+                if writer is not None and len(self.merges) % checkpoint_every == 0:
+                    writer.submit(self._dump_state())
+        except BaseException:
+            if writer is not None:
+                writer.wait()  # the last checkpoint reaches the disk before the run is given up
+            raise
+        stats.merge_seconds += time.perf_counter() - started
+        stats.sample_rss()
+        if progress_bar is not None:
+            progress_bar.close()
+        self.complete = True
+        if writer is not None:
+            writer.submit(self._dump_state())
+            writer.wait()
+        return self.vocab, [(self.vocab[left], self.vocab[right]) for left, right in self.merges]